@@ -1,17 +1,153 @@
+import os
 import socket
-import psutil
-import pickle
+import select
 import time
 
+from protocol import MessageBuffer, PickleEncoder, DeltaEncoder, pack_datagram
+from tracing import TRACE_EVERY
+
+# psutil and subprocess are imported where they are used: the lean agent
+# (--lean) never needs psutil, and most agents never start a task.
+
+SEND_INTERVAL = 2.0  # Seconds between samples (after the 1 s CPU measurement)
+HEARTBEAT_INTERVAL = 2.0  # Longest silence towards the master (it marks agents stale after 5 s)
+
+# Adaptive sampling (--adaptive)
+MIN_INTERVAL = 0.5   # Sampling interval while values move or an alert is active
+MAX_INTERVAL = 30.0  # A sample is sent at least this often, even if nothing changed
+DEADBAND = 2.0       # Unreported change: percentage points, or percent of the value for rates (net_rx, ...)
+BURST_SAMPLES = 5    # Fast samples sent after a change
+ALERT_LEVEL = 90.0   # CPU or RAM percent at which every fast sample is sent
+
+class Sampler:
+    """
+    Decides when to take the next sample and whether to send it. In fixed mode
+    every sample is sent, every `interval` seconds. In adaptive mode samples
+    within DEADBAND of the last one sent are skipped (at most MAX_INTERVAL
+    apart); a change switches to MIN_INTERVAL for a burst, as does an alert.
+    The collector can raise the interval to shed load (RATE command).
+    """
+
+    def __init__(self, interval, adaptive=False, min_interval=MIN_INTERVAL, max_interval=MAX_INTERVAL, deadband=DEADBAND):
+        self.interval = interval
+        self.adaptive = adaptive
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.deadband = deadband
+        self.floor = 0.0  # Minimum interval pushed by the collector
+        self.last_sent = None
+        self.last_time = float('-inf')
+        self.burst_left = 0
+        self.alert = False
+
+    def delay(self):
+        """Seconds until the next sample should be taken."""
+        fast = self.adaptive and (self.burst_left > 0 or self.alert)
+        return max(self.min_interval if fast else self.interval, self.floor)
+
+    def should_send(self, stats, now):
+        if not self.adaptive:
+            return True
+        self.alert = stats.get('cpu', 0.0) >= ALERT_LEVEL or stats.get('ram', 0.0) >= ALERT_LEVEL
+        if self.last_sent is None or now - self.last_time >= self.max_interval:
+            return True
+        if now - self.last_time < self.floor:
+            return False  # Rate limited by the collector
+        changed = stats.keys() != self.last_sent.keys() or any(
+            abs(value - self.last_sent[name]) > max(self.deadband, abs(self.last_sent[name]) * self.deadband / 100)
+            for name, value in stats.items())
+        if changed:
+            self.burst_left = BURST_SAMPLES
+            return True
+        if self.burst_left > 0:
+            self.burst_left -= 1
+            return True
+        return self.alert
+
+    def sent(self, stats, now):
+        self.last_sent = stats
+        self.last_time = now
+
+    def set_floor(self, min_interval):
+        # Never so slow that the collector would take the agent for dead
+        self.floor = min(max(float(min_interval), 0.0), self.max_interval)
+
 def get_system_stats():
     """
     Collects CPU and RAM utilization percentages.
     """
+    import psutil
     return {
         "cpu": psutil.cpu_percent(interval=1),
         "ram": psutil.virtual_memory().percent
     }
 
+def run_task(command, running):
+    """
+    Starts a task placed on this node by the master. The task runs in the
+    background with its output in task_<id>.log; the agent keeps reporting.
+    """
+    import subprocess
+
+    task_id = command.get("task_id")
+    try:
+        with open(f"task_{task_id}.log", "ab") as log:
+            proc = subprocess.Popen(command["args"], stdout=log, stderr=subprocess.STDOUT, stdin=subprocess.DEVNULL)
+    except (OSError, KeyError, TypeError) as e:
+        return {"type": "RESPONSE", "task_id": task_id, "status": "ERROR", "output": str(e)}
+    running.append(proc)
+    print(f"Started task {task_id}: {command['args']} (pid {proc.pid})")
+    return {"type": "RESPONSE", "task_id": task_id, "status": "OK", "output": f"pid {proc.pid}"}
+
+def handle_command(s, encoder, command, running, sampler):
+    """Handles one command from the master (see docs/next_step.md)."""
+    if command.get("type") != "COMMAND":
+        return
+    if command.get("cmd") == "CLOCK":
+        # Clock offset estimation for latency tracing: when we got the master's
+        # t0 (right after the recv that delivered it) and when we answer
+        received = time.monotonic()
+        s.sendall(encoder.encode_message({"type": "CLOCK", "t0": command.get("t0"), "t1": received, "t2": time.monotonic()}))
+        return
+    if command.get("cmd") == "RATE":
+        # Load shedding: no response, the point is to send less
+        sampler.set_floor(command.get("min_interval", 0.0))
+        print(f"Master set the minimum sampling interval to {sampler.floor:g}s")
+        if not sampler.adaptive:
+            # Heartbeats stretch with the floor (see main), so the collector must wait that much longer
+            s.sendall(encoder.encode_message({"type": "INTERVAL", "max_interval": sampler.floor}))
+        return
+    if command.get("cmd") == "EXECUTE":
+        response = run_task(command, running)
+    else:
+        response = {"type": "RESPONSE", "status": "ERROR", "output": f"Unknown command {command.get('cmd')}"}
+    s.sendall(encoder.encode_message(response))
+
+def run_udp(collect, master_host, master_port, agent_id, interval, heartbeat, verbose):
+    """
+    Best-effort reporting: one datagram per sample, no connection to keep up.
+    The master does not send commands to UDP agents. With a long interval,
+    empty datagrams in between keep the agent from being marked stale.
+    """
+    seq = 0
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+        print(f"Sending to {master_host}:{master_port} over UDP as agent '{agent_id}'.")
+        next_send = time.monotonic()
+        while True:
+            now = time.monotonic()
+            stats = collect() if now >= next_send else {}
+            try:
+                s.sendto(pack_datagram(agent_id, seq, stats), (master_host, master_port))
+            except OSError as e:
+                # Unreachable host, full buffer, ...: the sample is simply lost
+                print(f"Could not send sample {seq}: {e}")
+            if verbose and stats:
+                print(f"Sent data {seq}: {stats}")
+            seq += 1
+            if stats:
+                next_send += interval
+            time.sleep(max(0.0, min(next_send, time.monotonic() + heartbeat) - time.monotonic()))
+
 def main():
     """
     Main function to connect to the master server and send data.
@@ -21,23 +157,101 @@ def main():
     parser = argparse.ArgumentParser(description="Cluster Sentinel Agent")
     parser.add_argument('--host', type=str, default='127.0.0.1', help="Master server hostname or IP")
     parser.add_argument('--port', type=int, default=5000, help="Master server port")
+    parser.add_argument('--lean', action='store_true', help="Read /proc directly instead of psutil, no 1 s blocking sample, no per-sample logging")
+    parser.add_argument('--extended', action='store_true', help="Also report per-core CPU and network rates (uses /proc)")
+    parser.add_argument('--encoding', choices=['pickle', 'delta'], default='pickle',
+                        help="pickle: a pickled dict per sample; delta: schema once, then fixed-point deltas (default: pickle)")
+    parser.add_argument('--transport', choices=['tcp', 'udp'], default='tcp',
+                        help="tcp: connection with a command channel; udp: fire-and-forget datagrams (master needs --udp)")
+    parser.add_argument('--agent-id', type=str, default=None, help="Agent name; lets the master give back our slot after a warm restart (default: <hostname>:<pid>)")
+    parser.add_argument('--interval', type=float, default=SEND_INTERVAL, help=f"Seconds between samples (default: {SEND_INTERVAL})")
+    parser.add_argument('--heartbeat', type=float, default=HEARTBEAT_INTERVAL,
+                        help=f"Send a heartbeat after this many seconds without a message (default: {HEARTBEAT_INTERVAL})")
+    parser.add_argument('--adaptive', action='store_true',
+                        help="Send samples only on change (beyond --deadband), at least every --max-interval; burst on change or alert")
+    parser.add_argument('--min-interval', type=float, default=MIN_INTERVAL, help=f"Adaptive: burst sampling interval (default: {MIN_INTERVAL})")
+    parser.add_argument('--max-interval', type=float, default=MAX_INTERVAL, help=f"Adaptive: longest gap between samples (default: {MAX_INTERVAL})")
+    parser.add_argument('--trace-every', type=int, default=TRACE_EVERY,
+                        help=f"Send latency timestamps with one sample in this many, 0 = never (default: {TRACE_EVERY})")
+    parser.add_argument('--deadband', type=float, default=DEADBAND, help=f"Adaptive: unreported change in percentage points / percent (default: {DEADBAND})")
     args = parser.parse_args()
 
     master_host = args.host
     master_port = args.port
+    collect = get_system_stats
+    if args.lean or args.extended:
+        try:
+            from procfs import ProcStats
+            # CPU is measured over the whole interval since the previous sample
+            collect = ProcStats(per_core=args.extended, net=args.extended).read
+        except OSError as e:
+            print(f"/proc not available ({e}), falling back to psutil.")
+    agent_id = args.agent_id or f"{socket.gethostname()}:{os.getpid()}"
+    if args.transport == 'udp':
+        run_udp(collect, master_host, master_port, agent_id, args.interval, args.heartbeat, not args.lean)
+        return
+    encoder = DeltaEncoder() if args.encoding == 'delta' else PickleEncoder()
+    running = []  # Tasks started by the master, reaped as they finish
+    sampler = Sampler(args.interval, args.adaptive, args.min_interval, args.max_interval, args.deadband)
+    # Adaptive agents stay live through their MAX_INTERVAL samples, not heartbeats
+    heartbeat = float('inf') if args.adaptive else args.heartbeat
+
+    def heartbeat_interval():
+        # Under a RATE floor a heartbeat would only replace the sample it holds back
+        return heartbeat + sampler.floor
 
     while True:
         try:
             with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
                 s.connect((master_host, master_port))
                 print(f"Connected to master server at {master_host}:{master_port}.")
+                s.sendall(encoder.start())
+                s.sendall(encoder.encode_message({"type": "IDENTIFY", "agent_id": agent_id}))
+                if args.adaptive:
+                    # Lets the collector wait that long before taking us for dead
+                    s.sendall(encoder.encode_message({"type": "INTERVAL", "max_interval": args.max_interval}))
+                elif sampler.floor:
+                    # Still under the previous connection's RATE floor
+                    s.sendall(encoder.encode_message({"type": "INTERVAL", "max_interval": sampler.floor}))
+                sampler.last_sent = None  # Start with a full sample
+                seq = 0  # Samples sent on this connection (latency tracing)
+                messages = MessageBuffer()
+                next_send = time.monotonic()
+                next_heartbeat = next_send + heartbeat_interval()
 
                 while True:
-                    stats = get_system_stats()
-                    data = pickle.dumps(stats)
-                    s.sendall(data)
-                    print(f"Sent data: {stats}")
-                    time.sleep(2)
+                    # Wait for commands until the next sample (or heartbeat) is due
+                    wait = min(next_send, next_heartbeat) - time.monotonic()
+                    readable, _, _ = select.select([s], [], [], max(0.0, wait))
+                    if readable:
+                        data = s.recv(4096)
+                        if not data:
+                            raise ConnectionError("Master server closed the connection")
+                        for command in messages.feed(data):
+                            handle_command(s, encoder, command, running, sampler)
+                        continue
+
+                    if time.monotonic() < next_send:
+                        # Long sampling interval: tell the master we are alive
+                        s.sendall(encoder.encode_message({"type": "HEARTBEAT"}))
+                        next_heartbeat = time.monotonic() + heartbeat_interval()
+                        continue
+
+                    running[:] = [proc for proc in running if proc.poll() is None]
+                    stats = collect()
+                    now = time.monotonic()
+                    if sampler.should_send(stats, now):
+                        data = encoder.encode(stats)
+                        seq += 1
+                        if args.trace_every and seq % args.trace_every == 0:
+                            # Traced sample: when it was taken and sent, after the sample itself
+                            data += encoder.encode_message({"type": "TRACE", "seq": seq, "sampled": now, "sent": time.monotonic()})
+                        s.sendall(data)
+                        sampler.sent(stats, now)
+                        next_heartbeat = now + heartbeat_interval()
+                        if not args.lean:
+                            print(f"Sent data: {stats}")
+                    next_send = time.monotonic() + sampler.delay()
 
         except ConnectionRefusedError:
             print("Connection refused. Master server might not be running. Retrying in 5 seconds...")
@@ -0,0 +1,210 @@
+# aggregates.py
+#
+# Cluster-wide figures (agent count, stale count, and per metric the sum, sum
+# of squares, minimum, maximum and a histogram), kept up to date by the
+# collector on every slot write so readers get a summary in O(1) instead of
+# scanning the table.
+#
+# Everything lives in the shared-memory segment (see slot_table.py), because
+# several collector processes write the table:
+#
+#   block  AGGREGATE_FIELDS int64s, in the seqlock-protected header. This is
+#          all a reader copies.
+#   index  Writer-only bookkeeping after the table: each slot's state and
+#          values, and for each metric a min-heap and a max-heap of slot
+#          indices with each slot's position in them (an indexed heap), so a
+#          changed value is re-sorted in place in O(log n) and the extremes
+#          are always at the top.
+#
+# Values are stored as integers in 1/FIXED_POINT percent. A removal subtracts
+# exactly what the matching addition added, so the sums never drift however
+# long the collector runs.
+#
+# Callers hold the collectors' lock and the seqlock (slot_table does both).
+
+from collections import namedtuple
+
+METRICS = ('cpu', 'ram')
+FIXED_POINT = 1000       # Thousandths of a percent
+HISTOGRAM_BUCKETS = 10   # 0-10%, 10-20%, ..., 90% and above
+BUCKET_WIDTH = 100 / HISTOGRAM_BUCKETS
+
+# block: count, stale, then per metric: sum, sum of squares, min, max, buckets
+_COUNT = 0
+_STALE = 1
+_METRIC_FIELDS = 4 + HISTOGRAM_BUCKETS
+_SUM, _SUMSQ, _MIN, _MAX, _BUCKETS = range(5)
+AGGREGATE_FIELDS = 2 + len(METRICS) * _METRIC_FIELDS
+BLOCK_SIZE = AGGREGATE_FIELDS * 8
+
+# index: state per slot (0 = empty, 1 = active, 2 = active and stale), values
+# per metric, then per metric a min-heap and a max-heap (entries, positions)
+_EMPTY, _ACTIVE, _STALE_STATE = 0, 1, 2
+_INDEX_ARRAYS = 1 + len(METRICS) + len(METRICS) * 2 * 2
+
+
+def index_size(capacity):
+    return _INDEX_ARRAYS * capacity * 8
+
+
+def to_fixed(value):
+    return round(value * FIXED_POINT)
+
+
+def _bucket(key):
+    return min(max(int(key // (BUCKET_WIDTH * FIXED_POINT)), 0), HISTOGRAM_BUCKETS - 1)
+
+
+class _Heap:
+    """Heap of slot indices keyed by their values. Positions are stored +1 (0 = not in the heap)."""
+
+    def __init__(self, index, capacity, values, number, sign):
+        self.index = index
+        self.values = values  # Offset of the keyed values in the index
+        self.entries = (1 + len(METRICS) + number * 2) * capacity
+        self.positions = self.entries + capacity
+        self.sign = sign      # 1 = min-heap, -1 = max-heap
+
+    def _key(self, i):
+        return self.sign * self.index[self.values + self.index[self.entries + i]]
+
+    def _place(self, i, slot):
+        self.index[self.entries + i] = slot
+        self.index[self.positions + slot] = i + 1
+
+    def _sift_up(self, i):
+        slot = self.index[self.entries + i]
+        key = self.sign * self.index[self.values + slot]
+        while i > 0:
+            parent = (i - 1) // 2
+            if self._key(parent) <= key:
+                break
+            self._place(i, self.index[self.entries + parent])
+            i = parent
+        self._place(i, slot)
+
+    def _sift_down(self, i, size):
+        slot = self.index[self.entries + i]
+        key = self.sign * self.index[self.values + slot]
+        while True:
+            child = 2 * i + 1
+            if child >= size:
+                break
+            if child + 1 < size and self._key(child + 1) < self._key(child):
+                child += 1
+            if key <= self._key(child):
+                break
+            self._place(i, self.index[self.entries + child])
+            i = child
+        self._place(i, slot)
+
+    def push(self, slot, size):
+        """Adds a slot to a heap of `size` entries."""
+        self._place(size, slot)
+        self._sift_up(size)
+
+    def update(self, slot, size):
+        """Restores the order after the slot's value changed."""
+        i = self.index[self.positions + slot] - 1
+        self._sift_up(i)
+        self._sift_down(self.index[self.positions + slot] - 1, size)
+
+    def remove(self, slot, size):
+        """Removes a slot from a heap of `size` entries."""
+        i = self.index[self.positions + slot] - 1
+        self.index[self.positions + slot] = 0
+        last = size - 1
+        if i != last:
+            self._place(i, self.index[self.entries + last])
+            self.update(self.index[self.entries + i], last)
+
+    def top(self):
+        return self.sign * self._key(0)
+
+
+class Aggregates:
+    """Writer side. `block` and `index` are int64 ('q') views of the segment."""
+
+    def __init__(self, block, index, capacity):
+        self.block = block
+        self.index = index
+        self.capacity = capacity
+        self.heaps = []
+        for m in range(len(METRICS)):
+            values = (1 + m) * capacity
+            self.heaps.append((_Heap(index, capacity, values, 2 * m, 1), _Heap(index, capacity, values, 2 * m + 1, -1)))
+
+    def _add(self, base, key, sign):
+        block = self.block
+        block[base + _SUM] += sign * key
+        block[base + _SUMSQ] += sign * key * key
+        block[base + _BUCKETS + _bucket(key)] += sign
+
+    def update(self, slot, values=None, stale=False):
+        """Records a slot's new values, or that it was cleared (values=None)."""
+        block, index, capacity = self.block, self.index, self.capacity
+        old_state = index[slot]
+        new_state = _EMPTY if values is None else (_STALE_STATE if stale else _ACTIVE)
+        count = block[_COUNT]
+        added = old_state == _EMPTY and new_state != _EMPTY
+        removed = new_state == _EMPTY and old_state != _EMPTY
+        block[_STALE] += (new_state == _STALE_STATE) - (old_state == _STALE_STATE)
+        index[slot] = new_state
+
+        for m, heaps in enumerate(self.heaps):
+            base = 2 + m * _METRIC_FIELDS
+            values_at = (1 + m) * capacity + slot
+            if old_state != _EMPTY:
+                self._add(base, index[values_at], -1)
+            if new_state != _EMPTY:
+                key = to_fixed(values[m])
+                index[values_at] = key
+                self._add(base, key, 1)
+            for heap in heaps:
+                if added:
+                    heap.push(slot, count)
+                elif removed:
+                    heap.remove(slot, count)
+                elif new_state != _EMPTY:
+                    heap.update(slot, count)
+            low, high = heaps
+            size = count + added - removed
+            block[base + _MIN] = low.top() if size else 0
+            block[base + _MAX] = high.top() if size else 0
+
+        block[_COUNT] = count + added - removed
+
+    def reset(self):
+        for i in range(len(self.block)):
+            self.block[i] = 0
+        for i in range(len(self.index)):
+            self.index[i] = 0
+
+
+# --- Reader side ---
+
+MetricSummary = namedtuple('MetricSummary', ['mean', 'std', 'min', 'max', 'histogram'])
+Summary = namedtuple('Summary', ['version', 'count', 'stale'] + list(METRICS))
+
+
+def count_at_least(metric, percent):
+    """Agents at or above `percent`, at bucket resolution (the bucket holding `percent` counts)."""
+    return sum(metric.histogram[_bucket(to_fixed(percent)):])
+
+
+def decode(version, fields):
+    """Turns a copied block (a sequence of AGGREGATE_FIELDS ints) into a Summary."""
+    count = fields[_COUNT]
+    metrics = []
+    for m in range(len(METRICS)):
+        base = 2 + m * _METRIC_FIELDS
+        total, squares = fields[base + _SUM], fields[base + _SUMSQ]
+        histogram = tuple(fields[base + _BUCKETS:base + _BUCKETS + HISTOGRAM_BUCKETS])
+        if count:
+            mean = total / count / FIXED_POINT
+            # Exact in integers: n * sum(x^2) - sum(x)^2 cannot go negative
+            std = ((count * squares - total * total) ** 0.5) / count / FIXED_POINT
+        else:
+            mean = std = 0.0
+        metrics.append(MetricSummary(mean, std, fields[base + _MIN] / FIXED_POINT, fields[base + _MAX] / FIXED_POINT, histogram))
+    return Summary(version, count, fields[_STALE], *metrics)
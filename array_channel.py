@@ -0,0 +1,165 @@
+# array_channel.py
+#
+# Streaming channel for NumPy arrays over FIFOs, pipes and sockets.
+#
+# Each message is a small header (dtype + shape) followed by the raw array
+# bytes, so a consumer can start on the first array while the producer is
+# still working, without pickle and without allocating per message:
+#
+#   writer = ArrayWriter(open('shared.fifo', 'wb'))       # or a socket / pipe
+#   writer.send(data)
+#
+#   reader = ArrayReader(open('shared.fifo', 'rb'))
+#   buf = np.empty(15)
+#   for arr in reader.iter_into(buf):                     # fills buf in place
+#       ...
+
+import ast
+import struct
+
+import numpy as np
+
+CHANNEL_MAGIC = b'NPCH'
+# magic, descr length, ndim -- followed by the descr string and ndim int64 dims
+FRAME_HEADER = struct.Struct('<4sHB')
+DIM_FORMAT = '<{}q'
+
+
+def _describe(dtype):
+    """dtype -> bytes. Uses the same descr as .npy files so structured dtypes survive."""
+    return repr(np.lib.format.dtype_to_descr(dtype)).encode('ascii')
+
+
+class ArrayWriter:
+    """Writes framed arrays to a binary file object, pipe or socket."""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self._send = stream.sendall if hasattr(stream, 'sendall') else self._write_all
+        self._last_dtype = None
+        self._last_descr = b''
+
+    def _write_all(self, data):
+        # Unbuffered files and pipes may accept only part of a large write
+        view = memoryview(data)
+        while view:
+            n = self.stream.write(view)
+            view = view[n if n is not None else len(view):]
+
+    def send(self, arr):
+        arr = np.asarray(arr, order='C')
+        if arr.dtype.hasobject:
+            raise TypeError("ArrayWriter cannot send object arrays")
+        if self._last_dtype is None or arr.dtype != self._last_dtype:
+            self._last_dtype = arr.dtype
+            self._last_descr = _describe(arr.dtype)
+
+        header = (FRAME_HEADER.pack(CHANNEL_MAGIC, len(self._last_descr), arr.ndim)
+                  + self._last_descr
+                  + struct.pack(DIM_FORMAT.format(arr.ndim), *arr.shape))
+        self._send(header)
+        # memoryview of the array itself: the payload is never copied into a bytes object
+        if arr.nbytes:
+            self._send(memoryview(arr).cast('B'))
+
+    def flush(self):
+        if hasattr(self.stream, 'flush'):
+            self.stream.flush()
+
+    def close(self):
+        self.flush()
+        self.stream.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+class ArrayReader:
+    """
+    Reads framed arrays written by ArrayWriter. `recv()` allocates a new array,
+    `recv(out)` / `iter_into(out)` fill a preallocated one with readinto.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self._readinto = stream.recv_into if hasattr(stream, 'recv_into') else stream.readinto
+        self._fixed = bytearray(FRAME_HEADER.size)
+        self._meta = bytearray(256)
+        self._last_meta = None
+        self._dtype = None
+        self._shape = None
+
+    def _read_exact(self, view):
+        """Fills view completely. Returns False on a clean EOF before the first byte."""
+        got = 0
+        while got < len(view):
+            n = self._readinto(view[got:])
+            if not n:
+                if got == 0:
+                    return False
+                raise EOFError(f"Channel closed mid-frame ({got}/{len(view)} bytes)")
+            got += n
+        return True
+
+    def read_header(self):
+        """Reads the next frame header. Returns (dtype, shape), or None at end of stream."""
+        if not self._read_exact(memoryview(self._fixed)):
+            return None
+        magic, descr_len, ndim = FRAME_HEADER.unpack(self._fixed)
+        if magic != CHANNEL_MAGIC:
+            raise ValueError(f"Bad frame magic {magic!r}; stream out of sync")
+
+        meta_len = descr_len + 8 * ndim
+        if meta_len > len(self._meta):
+            self._meta = bytearray(meta_len)
+        meta = memoryview(self._meta)[:meta_len]
+        if not self._read_exact(meta):
+            raise EOFError("Channel closed mid-frame")
+
+        # Same header as the previous message (the usual case): reuse dtype and shape
+        if self._last_meta != meta:
+            self._last_meta = bytes(meta)
+            descr = ast.literal_eval(bytes(meta[:descr_len]).decode('ascii'))
+            self._dtype = np.lib.format.descr_to_dtype(descr)
+            self._shape = struct.unpack(DIM_FORMAT.format(ndim), meta[descr_len:])
+        return self._dtype, self._shape
+
+    def recv(self, out=None):
+        """Returns the next array (filling `out` if given), or None at end of stream."""
+        header = self.read_header()
+        if header is None:
+            return None
+        dtype, shape = header
+        if out is None:
+            out = np.empty(shape, dtype=dtype)
+        elif out.dtype != dtype or out.shape != shape or not out.flags.c_contiguous:
+            raise ValueError(f"Buffer {out.dtype}{out.shape} does not match message {dtype}{shape}")
+        if out.nbytes and not self._read_exact(memoryview(out).cast('B')):
+            raise EOFError("Channel closed mid-frame")
+        return out
+
+    def iter_into(self, out):
+        """Yields `out` once per message, refilled in place each time."""
+        while self.recv(out) is not None:
+            yield out
+
+    def __iter__(self):
+        while True:
+            arr = self.recv()
+            if arr is None:
+                return
+            yield arr
+
+    def close(self):
+        self.stream.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
@@ -0,0 +1,120 @@
+# capture.py
+#
+# Recording of raw agent traffic for replay.py.
+#
+# `master_server.py --capture PATH` makes every collector process append what
+# it receives, exactly as received, to its own file (PATH.<worker> for the TCP
+# collectors, PATH.udp for the UDP collector). A restarted collector starts a
+# new file (PATH.<worker>.1, .2, ...) rather than overwriting what the previous
+# one recorded. A file is a magic string followed by records:
+#
+#     record = time(float64, wall clock) conn(uint32) kind(uint8) length(uint32) payload
+#
+# OPEN carries the peer address, DATA the bytes of one recv(), CLOSE nothing,
+# DATAGRAM one UDP datagram. Wall-clock times let replay.py merge the files of
+# several processes.
+
+import itertools
+import os
+import re
+import struct
+import threading
+import time
+
+FILE_MAGIC = b'CSCAP001'
+RECORD = struct.Struct('<dIBI')
+
+OPEN = 1
+DATA = 2
+CLOSE = 3
+DATAGRAM = 4
+
+# <worker> or udp, then the restart number if the collector was restarted
+_SUFFIX = re.compile(r'(\d+|udp)(?:\.(\d+))?')
+
+FLUSH_INTERVAL = 1.0  # Seconds; the collectors are terminated without a chance to flush
+
+
+class CaptureWriter:
+    """
+    Appends records to a new capture file: `path`, or if that exists (a
+    restarted collector) the first free `path`.1, `path`.2, ... Safe to share
+    between client threads.
+    """
+
+    def __init__(self, path):
+        for n in itertools.count():
+            self.path = f"{path}.{n}" if n else path
+            try:
+                self._file = open(self.path, 'xb')
+                break
+            except FileExistsError:
+                continue
+        self._file.write(FILE_MAGIC)
+        self._lock = threading.Lock()
+        self._conn_ids = iter(range(1, 1 << 32))
+        threading.Thread(target=self._flush_loop, daemon=True).start()
+
+    def new_conn(self, peer, at=None):
+        """Records a new connection and returns its id."""
+        with self._lock:
+            conn_id = next(self._conn_ids)
+        self.write(conn_id, OPEN, str(peer).encode('utf-8'), at)
+        return conn_id
+
+    def write(self, conn_id, kind, payload=b'', at=None):
+        """Appends one record, stamped with the current time unless `at` is given."""
+        record = RECORD.pack(time.time() if at is None else at, conn_id, kind, len(payload))
+        with self._lock:
+            self._file.write(record)
+            self._file.write(payload)
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(FLUSH_INTERVAL)
+            with self._lock:
+                if self._file.closed:
+                    return
+                self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+def read_capture(path):
+    """Yields (time, conn_id, kind, payload) for every complete record in a capture file."""
+    with open(path, 'rb') as f:
+        if f.read(len(FILE_MAGIC)) != FILE_MAGIC:
+            raise ValueError(f"{path} is not a capture file")
+        while True:
+            header = f.read(RECORD.size)
+            if len(header) < RECORD.size:
+                return  # End of file (or a record cut off when the collector was killed)
+            t, conn_id, kind, length = RECORD.unpack(header)
+            payload = f.read(length)
+            if len(payload) < length:
+                return
+            yield t, conn_id, kind, payload
+
+
+def _file_order(suffix):
+    match = _SUFFIX.fullmatch(suffix)
+    worker, start = match.groups()
+    return (worker == 'udp', int(worker) if worker != 'udp' else 0, int(start or 0))
+
+
+def capture_files(path):
+    """The files written for --capture PATH, in worker order (and start order per worker)."""
+    directory, base = os.path.split(os.path.abspath(path))
+    suffixes = [name[len(base) + 1:] for name in os.listdir(directory) if name.startswith(base + '.')]
+    suffixes = sorted((s for s in suffixes if _SUFFIX.fullmatch(s)), key=_file_order)
+    return [os.path.join(directory, f"{base}.{s}") for s in suffixes]
+
+
+def remove_capture(path):
+    """Removes the files of an earlier capture to PATH; returns how many there were."""
+    files = capture_files(path)
+    for name in files:
+        os.remove(name)
+    return len(files)
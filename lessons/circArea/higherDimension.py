@@ -6,15 +6,18 @@ import random
 import numpy as np
 import numba
 
+N_TOTAL = 10000000 # The larger the number of trials, the more accurate the area becomes
+
 ### Process is slow because Python is an interpreted language -> so use numba
-@numba.jit
-def doCalculation():
+# cache=True: the compiled machine code is saved to disk (next to this file, or in
+# $NUMBA_CACHE_DIR) and loaded by later runs instead of compiling again
+@numba.jit(nopython=True, cache=True)
+def doCalculation(nTotal):
 	# Define variables
 	r = 1
 	nDim = 3
 	volumeNDim = (2*r)**nDim
 	nAccept = 0
-	nTotal = 10000000 # The larger the number of trials, the more accurate the area becomes
 
 	for i in range(nTotal):
 		rNewSqrd = 0
@@ -32,6 +35,13 @@ def doCalculation():
 
 	return volumeNDim, nAccept, nTotal
 
-volumeNDim, nAccept, nTotal = doCalculation()
-volume = volumeNDim * nAccept/nTotal
-print(volume)
+def warmUp():
+	# Compile (or load from the cache) and run once with a tiny trial count, so the
+	# next call with N_TOTAL only computes. Same argument type -> same compiled version
+	doCalculation(1)
+
+# Only compute when run as a script, not when imported (e.g. by client_impl.py)
+if __name__ == "__main__":
+	volumeNDim, nAccept, nTotal = doCalculation(N_TOTAL)
+	volume = volumeNDim * nAccept/nTotal
+	print(volume)
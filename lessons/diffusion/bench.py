@@ -1,13 +1,19 @@
 from numba import njit, prange
 import numpy as np, time, numba
 
-@njit(parallel=True)
+# cache=True: later runs load the compiled kernel from disk ($NUMBA_CACHE_DIR if set)
+@njit(parallel=True, cache=True)
 def work(n):
     s = 0
     for i in prange(n):
         s += i % 7
     return s
 
+# Compile (or load from the cache) first, so the timing below is the computation only
+t0 = time.time()
+work(1)
+print("Compile/load:", time.time()-t0)
+
 t0 = time.time()
 work(10**10)
 print("Elapsed:", time.time()-t0, "Threads:", numba.get_num_threads())
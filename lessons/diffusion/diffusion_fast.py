@@ -15,7 +15,7 @@ nstep = 100
 n = 1000
 infProb = 0.1
 
-@numba.njit(parallel=True)
+@numba.njit(parallel=True, cache=True)
 def update(x, infProb):
     #xNext = np.array(x)
     xNext = np.copy(x)
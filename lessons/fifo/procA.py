@@ -1,9 +1,13 @@
 #!/usr/bin/env python
 import os
+import sys
 import time
 import tempfile
 import numpy as np
-import pickle
+#import pickle
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "../.."))
+from array_channel import ArrayWriter
 
 # tempdir = tempfile.mkdtemp()
 # tempfilePath = f'{tempdir}/shared.fifo'
@@ -14,19 +18,24 @@ print(f"FIFO filename = {tempfilePath}")
 os.mkfifo(tempfilePath)  # Instead of storing output in hard drive, create temporary RAM file
 
 fout = open(tempfilePath, "wb")
-datas = []
+writer = ArrayWriter(fout)
+#datas = []
 for i in range (10):
 	data = np.random.uniform(0, 1, 15)
 
 	print("writing data to fifo ", i)
 	# fout.write(f'data produced by process A {i}\n')
 	# fout.write(data)
-	datas.append(data)
+	#datas.append(data)
+	# Stream each array as soon as it exists (header + raw bytes, no pickle),
+	# so procB can start working on it right away
+	writer.send(data)
+	writer.flush()
 
 # Serialize our data (using pickle)
-pickle.dump(datas, fout)
+#pickle.dump(datas, fout)
 
 #fout.flush()  # Force data save into file
 #time.sleep(1)
-fout.close()
+writer.close()
 os.remove('shared.fifo')
@@ -2,19 +2,28 @@
 import os
 import sys
 import time
-import pickle
+#import pickle
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "../.."))
+from array_channel import ArrayReader
 
 fifoName = sys.argv[1]
 
 fin = open(fifoName, "rb")
-data = pickle.load(fin)
+#data = pickle.load(fin)
+reader = ArrayReader(fin)
 
 #for _ in range(100):
 #	data = fin.read()
 #	print(data)
 #	time.sleep(1)
-print(data)
-print(len(data))
-print(type(data))
-print(type(data[0]), len(data[0]), data[0].shape())
+
+# Arrays arrive one at a time; read each into the same preallocated buffer
+buf = np.empty(15)
+count = 0
+for data in reader.iter_into(buf):
+	print(count, type(data), data.shape, data.mean())
+	count += 1
+print(f"Received {count} arrays")
 fin.close()
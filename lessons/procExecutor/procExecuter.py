@@ -4,6 +4,7 @@ from concurrent.futures import ProcessPoolExecutor
 import time
 import os
 import numpy as np
+from shmExecutor import ShmPoolExecutor, shmEmpty
 
 def fun(index, data):
     print(f"Sub fuction is executed PID={os.getpid()}")
@@ -30,14 +31,18 @@ def doCircArea(index, r, nDim, nTotal):
     return aSqr, nAccept, nTotal
 
 def makeBigData(index, size):
-    data = np.ones(size)
+    #data = np.ones(size)
+    # Allocated in shared memory: the parent gets a view instead of a pickled copy
+    data = shmEmpty(size)
+    data.fill(1)
     return data
 
 print(f"Main process is started PID={os.getpid()}")
 #fun()
 #myData = np.random.uniform(0, 1, size=(30, 100,100))
 
-executor = ProcessPoolExecutor(max_workers=3)
+#executor = ProcessPoolExecutor(max_workers=3)
+executor = ShmPoolExecutor(max_workers=3)
 #executor = ThreadPoolExecutor(max_workers=3)
 jobs = []
 #for i in range(myData.shape[0]):
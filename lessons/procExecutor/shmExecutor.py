@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+# Zero-copy result transport for ProcessPoolExecutor.
+#
+# A normal executor pickles the returned array, pushes it through a pipe and
+# rebuilds it in the parent, so an 8 GB result briefly lives twice in the parent.
+# Here the worker writes its result into a memory-mapped file on /dev/shm (RAM,
+# same as multiprocessing.shared_memory) and only sends back a small handle.
+# The parent maps the file as a NumPy view and unlinks the name right away, so
+# the kernel frees the memory as soon as the last view is garbage collected.
+import os
+import mmap
+import uuid
+import tempfile
+from collections import namedtuple
+from concurrent.futures import Future, ProcessPoolExecutor
+
+import numpy as np
+
+# What actually travels through the pipe instead of the array
+ShmHandle = namedtuple('ShmHandle', ['path', 'offset', 'shape', 'dtype'])
+
+_segmentDir = None
+_pending = []  # (path, array) allocated by shmEmpty during the current job
+
+
+def defaultSegmentDir():
+    """/dev/shm keeps segments in RAM; fall back to the temp dir elsewhere."""
+    if os.path.isdir('/dev/shm'):
+        return '/dev/shm'
+    return tempfile.gettempdir()
+
+
+def _mapFile(path, nbytes, create=False):
+    flags = os.O_RDWR | (os.O_CREAT | os.O_EXCL if create else 0)
+    fd = os.open(path, flags, 0o600)
+    try:
+        if create:
+            os.ftruncate(fd, max(nbytes, 1))
+        return mmap.mmap(fd, max(nbytes, 1))
+    finally:
+        # The mapping keeps the file alive, the descriptor is not needed anymore
+        os.close(fd)
+
+
+def shmEmpty(shape, dtype=float):
+    """
+    Allocates an uninitialized array in shared memory. Call this inside a job
+    submitted to ShmPoolExecutor and return the array (or a contiguous slice of
+    it) to hand it to the parent without any copy.
+    """
+    dtype = np.dtype(dtype)
+    shape = (shape,) if np.isscalar(shape) else tuple(shape)
+    count = int(np.prod(shape))
+    directory = _segmentDir or defaultSegmentDir()
+    path = os.path.join(directory, f'shmexec_{os.getpid()}_{uuid.uuid4().hex}')
+    mm = _mapFile(path, count * dtype.itemsize, create=True)
+    arr = np.frombuffer(mm, dtype=dtype, count=count).reshape(shape)
+    _pending.append((path, arr))
+    return arr
+
+
+def _initWorker(directory):
+    global _segmentDir
+    _segmentDir = directory
+
+
+def _toHandle(result):
+    """Finds the segment backing result, copying into a new one only if needed."""
+    for path, arr in _pending:
+        base = result
+        while isinstance(base, np.ndarray) and base is not arr:
+            base = base.base
+        if base is arr and result.flags.c_contiguous:
+            offset = result.ctypes.data - arr.ctypes.data
+            return ShmHandle(path, offset, result.shape, result.dtype.str)
+
+    # Plain array (e.g. np.ones): one copy here, still no pickling through the pipe
+    out = shmEmpty(result.shape, result.dtype)
+    out[...] = result
+    return ShmHandle(_pending[-1][0], 0, result.shape, result.dtype.str)
+
+
+def _runJob(fn, args, kwargs):
+    """Runs in the worker. Arrays are swapped for a handle before returning."""
+    del _pending[:]
+    keep = None
+    try:
+        result = fn(*args, **kwargs)
+        if isinstance(result, np.ndarray) and not result.dtype.hasobject:
+            result = _toHandle(result)
+            keep = result.path
+        return result
+    finally:
+        # Segments the parent will not adopt are removed here. Dropping the
+        # arrays unmaps them in this worker, the parent maps its own view.
+        for path, _ in _pending:
+            if path != keep:
+                os.unlink(path)
+        del _pending[:]
+
+
+def attach(handle):
+    """Maps a result segment as a NumPy array in this process (no copy)."""
+    dtype = np.dtype(handle.dtype)
+    count = int(np.prod(handle.shape))
+    try:
+        mm = _mapFile(handle.path, handle.offset + count * dtype.itemsize)
+    finally:
+        # Unlink immediately: the mapping holds the memory, so it is released
+        # exactly when the last array referencing it goes away.
+        os.unlink(handle.path)
+    return np.frombuffer(mm, dtype=dtype, count=count, offset=handle.offset).reshape(handle.shape)
+
+
+class ShmPoolExecutor:
+    """
+    ProcessPoolExecutor wrapper whose jobs return NumPy arrays through shared
+    memory. Non-array results are passed through unchanged.
+
+        with ShmPoolExecutor(max_workers=3) as executor:
+            job = executor.submit(makeBigData, 0, 10**9)
+            data = job.result()   # view onto the worker's segment
+    """
+
+    def __init__(self, max_workers=None, directory=None):
+        self.directory = directory or defaultSegmentDir()
+        self._executor = ProcessPoolExecutor(max_workers=max_workers,
+                                             initializer=_initWorker,
+                                             initargs=(self.directory,))
+
+    def submit(self, fn, *args, **kwargs):
+        outer = Future()
+        inner = self._executor.submit(_runJob, fn, args, kwargs)
+
+        def _done(job):
+            if job.cancelled():
+                outer.cancel()
+                outer.set_running_or_notify_cancel()
+                return
+            try:
+                result = job.result()
+                if isinstance(result, ShmHandle):
+                    result = attach(result)
+            except BaseException as e:
+                outer.set_exception(e)
+            else:
+                outer.set_result(result)
+
+        # Attach as soon as the job finishes so no segment outlives the pool
+        inner.add_done_callback(_done)
+        return outer
+
+    def map(self, fn, *iterables):
+        jobs = [self.submit(fn, *args) for args in zip(*iterables)]
+        for job in jobs:
+            yield job.result()
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        self._executor.shutdown(wait=wait, cancel_futures=cancel_futures)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown(wait=True)
+        return False
@@ -3,21 +3,30 @@ import socket
 import struct
 import os
 import sys
-sys.path.append("../circArea")
-from higherDimension import doCalculation
+import time
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "../circArea"))
+from higherDimension import doCalculation, warmUp, N_TOTAL
 
 HOST, PORT = "163.180.2.245", 14230
 
+# --prewarm: compile (or load from the numba cache) and run the kernel once before
+# connecting, so the server only sees a worker that is ready to compute and the
+# first COMPUTE round-trip measures the computation, not the compilation
+if "--prewarm" in sys.argv:
+	t0 = time.time()
+	warmUp()
+	print(f"[Client] Kernel ready in {time.time()-t0:.2f}s")
+
 print(f"[Client] Client is connecting to server")
 s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
 s.connect((HOST, PORT)) # Connect to initiated server
 print(f"[Client] Connection is established")
 
-# Receive data
-cmd = s.recv(1024) # Size of data from server
-print(f"[Client] Received from server: {cmd}")  # For debugging
 try:
 	while True:
+		# Receive data
+		cmd = s.recv(1024) # Size of data from server
+		print(f"[Client] Received from server: {cmd}")  # For debugging
 		if cmd == b"WHO":
 			# Send pid
 			pid = os.getpid()
@@ -26,7 +35,9 @@ try:
 		elif cmd == b"COMPUTE":
 			print(f"[Client] Running computation")
 
-			volumeNDim, nAccept, nTotal = doCalculation()
+			t0 = time.time()
+			volumeNDim, nAccept, nTotal = doCalculation(N_TOTAL)
+			print(f"[Client] Computation took {time.time()-t0:.2f}s")
 			data = struct.pack('f 2i', volumeNDim, nAccept, nTotal)
 			s.sendall(data)
 		else:
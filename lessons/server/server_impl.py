@@ -3,6 +3,7 @@ import socket
 import struct # for encoding/decoding
 from concurrent.futures import ThreadPoolExecutor
 import threading
+import time
 
 lock = threading.Lock()
 
@@ -20,12 +21,14 @@ def handle_client(conn, addr):
 
 			# Send data
 #			conn.sendall(b'WHO')
+			t0 = time.time()
 			conn.sendall(b'COMPUTE') # b for encrypting into bytes
 
 			# Receive data
 			data = conn.recv(1024) # 1024 bytes of data (32-bit)
 			volumeNDim, nAccept, nTotal = struct.unpack('f 2i', data)  # Can use arguments to define other types of data i, s, etc.
-			print(f"[Server: Thread] Received data from {addr}: {volumeNDim}, {nAccept}, {nTotal}")
+			# Round-trip time: includes numba compilation on the first round unless the client ran with --prewarm
+			print(f"[Server: Thread] Received data from {addr}: {volumeNDim}, {nAccept}, {nTotal} ({time.time()-t0:.2f}s)")
 			with lock:
 				nAcceptAll += nAccept
 				nTotalAll += nTotal
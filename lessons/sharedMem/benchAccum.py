@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+# Global Lock (sharedMem.py pattern) vs. sharded accumulation, 1-100 processes.
+#
+# Every process adds 1 to each element of a shared array, exactly like
+# myFunction in sharedMem.py (minus the sleep, which would hide the locking cost).
+#
+#   python benchAccum.py --length 10000 --procs 1 2 5 10 20 50 100
+import time
+import argparse
+import numpy as np
+from multiprocessing import shared_memory, Process, Lock, Pool, resource_tracker
+
+from shardedAccum import ShardedAccumulator
+
+
+def globalLockWorker(shm_name, shape, dtype, lock):
+	shm = shared_memory.SharedMemory(name=shm_name)
+	arr = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+	for i in range(len(arr)):
+		with lock:
+			arr[i] += 1
+	del arr
+	shm.close()
+
+
+def shardedWorker(index, acc):
+	shard = acc.shard(index)
+	for i in range(len(shard)):
+		shard[i] += 1
+
+
+def stripedWorker(index, acc):
+	for i in range(acc.length):
+		acc.sharedAdd(i, 1)
+
+
+def runProcs(target, argsList):
+	procs = [Process(target=target, args=args) for args in argsList]
+	t0 = time.perf_counter()
+	for proc in procs:
+		proc.start()
+	for proc in procs:
+		proc.join()
+	return time.perf_counter() - t0
+
+
+def benchGlobalLock(length, nProc):
+	shm = shared_memory.SharedMemory(create=True, size=length * 8)
+	arr = np.ndarray(length, dtype='float', buffer=shm.buf)
+	arr[:] = 0
+	lock = Lock()
+	elapsed = runProcs(globalLockWorker, [(shm.name, arr.shape, arr.dtype, lock)] * nProc)
+	assert arr.sum() == length * nProc
+	del arr
+	shm.close()
+	shm.unlink()
+	return elapsed
+
+
+def benchSharded(length, nProc, pool):
+	acc = ShardedAccumulator(length, nShards=nProc)
+	elapsed = runProcs(shardedWorker, [(i, acc) for i in range(nProc)])
+	t0 = time.perf_counter()
+	total = acc.reduce(pool)
+	reduceTime = time.perf_counter() - t0
+	assert total.sum() == length * nProc
+	acc.close()
+	acc.unlink()
+	return elapsed + reduceTime, reduceTime
+
+
+def benchStriped(length, nProc, nLocks):
+	acc = ShardedAccumulator(length, nShards=1, nLocks=nLocks)
+	elapsed = runProcs(stripedWorker, [(i, acc) for i in range(nProc)])
+	assert acc.reduce().sum() == length * nProc
+	acc.close()
+	acc.unlink()
+	return elapsed
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description="Global lock vs. sharded shared-memory accumulation")
+	parser.add_argument('--length', type=int, default=10000, help="Array length (default: 10000)")
+	parser.add_argument('--procs', type=int, nargs='+', default=[1, 2, 5, 10, 20, 50, 100], help="Process counts to test")
+	parser.add_argument('--locks', type=int, default=16, help="Lock stripes for the striped variant (default: 16)")
+	parser.add_argument('--reduce-workers', type=int, default=4, help="Pool size for the tree reduction (default: 4)")
+	args = parser.parse_args()
+
+	print(f"{'procs':>6} {'global lock':>12} {'striped':>10} {'sharded':>10} {'(reduce)':>10} {'speedup':>8}")
+	# Start the resource tracker before forking the pool so its workers share it
+	# instead of each starting one that "cleans up" segments it never owned
+	resource_tracker.ensure_running()
+	with Pool(args.reduce_workers) as pool:
+		for nProc in args.procs:
+			tGlobal = benchGlobalLock(args.length, nProc)
+			tStriped = benchStriped(args.length, nProc, args.locks)
+			tSharded, tReduce = benchSharded(args.length, nProc, pool)
+			print(f"{nProc:>6} {tGlobal:>11.3f}s {tStriped:>9.3f}s {tSharded:>9.3f}s {tReduce:>9.4f}s {tGlobal / tSharded:>7.1f}x")
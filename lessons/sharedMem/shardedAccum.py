@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+# Contention-free accumulation into a shared-memory array.
+#
+# sharedMem.py makes every process take one global Lock for every arr[i] += 1,
+# so the work is fully serialized. Here each process owns a private row (shard)
+# of one shared-memory block and updates it without any lock. The shards are
+# summed with a pairwise tree reduction, in parallel when a Pool is given, at the
+# end or whenever a total is wanted. A small set of striped locks guards one
+# extra row for the rare updates that really have to be shared.
+#
+# Layout of the block (all rows have `length` elements):
+#   [ shard 0 | ... | shard nShards-1 | shared row | scratch 0 | ... ]
+import numpy as np
+from multiprocessing import shared_memory, Lock
+
+
+def _scratchRows(nShards):
+	return (nShards + 1) // 2
+
+
+def _rows(shm, length, nRows, dtype):
+	return np.ndarray((nRows, length), dtype=dtype, buffer=shm.buf)
+
+
+def _addPair(rows, dst, srcA, srcB, lo, hi):
+	"""One node of the reduction tree: rows[dst] = rows[srcA] + rows[srcB] on [lo, hi)."""
+	if srcB is None:
+		rows[dst, lo:hi] = rows[srcA, lo:hi]
+	else:
+		np.add(rows[srcA, lo:hi], rows[srcB, lo:hi], out=rows[dst, lo:hi])
+
+
+def _reduceBatch(name, length, nRows, dtype, pairs):
+	"""Pool task: attaches to the segment, adds a batch of pairs and detaches again."""
+	shm = shared_memory.SharedMemory(name=name)
+	rows = _rows(shm, length, nRows, dtype)
+	for pair in pairs:
+		_addPair(rows, *pair)
+	del rows  # No view may outlive the mapping
+	shm.close()
+
+
+class ShardedAccumulator:
+	"""
+	Array of `length` counters that nShards processes can update concurrently.
+
+	    acc = ShardedAccumulator(1000, nShards=100, nLocks=16)
+	    Process(target=work, args=(i, acc))   # the child calls acc.shard(i)
+	    ...
+	    total = acc.reduce(pool)
+
+	The object can be passed to a Process; the child re-attaches to the same
+	segment by name.
+	"""
+
+	def __init__(self, length, nShards, dtype='float', nLocks=0):
+		self.length = length
+		self.nShards = nShards
+		self.dtype = np.dtype(dtype)
+		self.nRows = nShards + 1 + _scratchRows(nShards)
+		self._owner = True
+		self.shm = shared_memory.SharedMemory(create=True, size=max(self.nRows * length * self.dtype.itemsize, 1))
+		self.rows = _rows(self.shm, length, self.nRows, self.dtype)
+		self.rows[:] = 0
+		self.locks = [Lock() for _ in range(nLocks)]
+
+	def __getstate__(self):
+		return (self.shm.name, self.length, self.nShards, self.dtype.str, self.locks)
+
+	def __setstate__(self, state):
+		name, self.length, self.nShards, dtype, self.locks = state
+		self.dtype = np.dtype(dtype)
+		self.nRows = self.nShards + 1 + _scratchRows(self.nShards)
+		self._owner = False
+		self.shm = shared_memory.SharedMemory(name=name)
+		self.rows = _rows(self.shm, self.length, self.nRows, self.dtype)
+
+	# --- Updates ---
+
+	def shard(self, index):
+		"""Private row of process `index`. Update it freely, no lock needed."""
+		return self.rows[index]
+
+	@property
+	def shared(self):
+		return self.rows[self.nShards]
+
+	def sharedAdd(self, i, value):
+		"""Adds to the shared row under the lock stripe that covers element i."""
+		if not self.locks:
+			raise RuntimeError("ShardedAccumulator was created without striped locks (nLocks=0)")
+		with self.locks[i % len(self.locks)]:
+			self.rows[self.nShards, i] += value
+
+	# --- Reduction ---
+
+	def _plan(self):
+		"""Rounds of (dst, srcA, srcB) row triples; the tree ends in the first scratch row."""
+		scratch = self.nShards + 1
+		rounds = [[(scratch + k, 2 * k, 2 * k + 1 if 2 * k + 1 < self.nShards else None)
+				   for k in range(_scratchRows(self.nShards))]]
+		# Fold the shared row into the first leaf so it is part of the total
+		rounds.append([(scratch, scratch, self.nShards)])
+		width = _scratchRows(self.nShards)
+		stride = 1
+		while stride < width:
+			rounds.append([(scratch + k, scratch + k, scratch + k + stride)
+						   for k in range(0, width - stride, 2 * stride)])
+			stride *= 2
+		return rounds
+
+	def reduce(self, pool=None, chunks=None):
+		"""
+		Returns the element-wise total of all shards plus the shared row. The
+		shards are left untouched, so this can run while workers keep updating
+		(the result is then a recent, not an atomic, total).
+
+		With a multiprocessing Pool every tree level runs in parallel, each pair
+		additionally split into `chunks` column ranges (default: pool size).
+		A level is one task per worker, which attaches to the segment only for
+		that task, so the workers hold no mapping once reduce() returns.
+		Create the Pool after the first SharedMemory (or after
+		resource_tracker.ensure_running()) so its workers share our tracker.
+		"""
+		workers = getattr(pool, '_processes', 1) if pool is not None else 1
+		if chunks is None:
+			chunks = workers
+		bounds = np.linspace(0, self.length, max(1, chunks) + 1, dtype=int)
+		spans = [(lo, hi) for lo, hi in zip(bounds[:-1], bounds[1:]) if hi > lo]
+
+		for level in self._plan():
+			pairs = [(dst, a, b, lo, hi) for dst, a, b in level for lo, hi in spans]
+			if pool is None:
+				for pair in pairs:
+					_addPair(self.rows, *pair)
+			else:
+				# starmap blocks until the level is done, which is the barrier between levels
+				header = (self.shm.name, self.length, self.nRows, self.dtype.str)
+				batches = [pairs[k::workers] for k in range(min(workers, len(pairs)))]
+				pool.starmap(_reduceBatch, [header + (batch,) for batch in batches], chunksize=1)
+
+		return np.array(self.rows[self.nShards + 1])
+
+	# --- Cleanup ---
+
+	def close(self):
+		self.rows = None
+		self.shm.close()
+
+	def unlink(self):
+		if self._owner:
+			self.shm.unlink()
@@ -1,6 +1,6 @@
 #!/usr/bin/env python
 import numpy as np
-import matplotlib.pyplot as plt
+from concurrent.futures import ProcessPoolExecutor
 
 def makePrices(price0, nsteps=100, seed=None):
 	if seed != None:
@@ -36,12 +36,117 @@ def doAction(prices, mvavgs, width, cash0=100, stock0=0):
 
 	return cash0 + stock0, cash + stock
 
+# --- Vectorized engine ---
+# Same model as above, but a whole price path is one random draw + cumsum, and
+# moving averages come from cumulative sums in O(n) instead of O(n*width).
+
+def makePricesBatch(price0, nsteps=100, seeds=None, npaths=1):
+	"""
+	Price paths as a (npaths, nsteps+1) int array. With `seeds`, row k is the
+	same path makePrices(price0, nsteps, seeds[k]) would give.
+	"""
+	if seeds is None:
+		steps = np.random.randint(-1, 2, size=(npaths, nsteps))
+	else:
+		steps = np.empty((len(seeds), nsteps), dtype=int)
+		for k, seed in enumerate(seeds):
+			steps[k] = np.random.RandomState(seed).randint(-1, 2, size=nsteps)
+	prices = np.empty((steps.shape[0], nsteps + 1), dtype=int)
+	prices[:, 0] = price0
+	np.cumsum(steps, axis=1, out=prices[:, 1:])
+	prices[:, 1:] += price0
+	return prices
+
+def movingAvgFast(prices, width):
+	"""movingAvg for a path or a batch of paths (last axis is time)."""
+	prices = np.asarray(prices)
+	csum = np.zeros(prices.shape[:-1] + (prices.shape[-1] + 1,))
+	np.cumsum(prices, axis=-1, out=csum[..., 1:])
+	n = prices.shape[-1] - width
+	return (csum[..., width:width + n] - csum[..., :n]) / width
+
+def backtestGrid(prices, widths, cash0=100, stock0=0):
+	"""
+	Runs doAction for every (path, width) pair at once.
+	prices: (npaths, nsteps+1) array. Returns (initial, final), each (npaths, len(widths)).
+	Time is still a loop (the strategy is stateful) but each step is one array
+	operation over all combinations.
+	"""
+	prices = np.asarray(prices)
+	npaths, length = prices.shape
+	widths = np.asarray(widths, dtype=int)
+	# One row per combination: path index and width
+	path = np.repeat(np.arange(npaths), len(widths))
+	width = np.tile(widths, npaths)
+
+	csum = np.zeros((npaths, length + 1))
+	np.cumsum(prices, axis=1, out=csum[:, 1:])
+
+	cash = np.full(path.shape, cash0, dtype=int)
+	stock = np.full(path.shape, stock0, dtype=int)
+	stopped = np.zeros(path.shape, dtype=bool)
+
+	for t in range(widths.min(), length):
+		# Moving average of prices[t-width:t], as in movingAvg/doAction
+		active = (t >= width) & ~stopped
+		start = np.maximum(t - width, 0)
+		m = (csum[path, t] - csum[path, start]) / width
+		p = prices[path, t]
+
+		buy = active & (p < m) & (cash > 0)
+		sell = active & ~buy & (p > m) & (stock > 0)
+		half = cash // 2
+		stock = np.where(buy, stock + half, stock)
+		cash = np.where(buy, cash - half, cash)
+		kept = stock - stock // 2
+		cash = np.where(sell, cash + kept // 2, cash)
+		stock = np.where(sell, kept, stock)
+
+		stopped |= active & (cash == 0)
+
+	initial = np.full((npaths, len(widths)), cash0 + stock0)
+	return initial, (cash + stock).reshape(npaths, len(widths))
+
+def _sweepChunk(price0, nsteps, seeds, widths):
+	return backtestGrid(makePricesBatch(price0, nsteps, seeds), widths)[1]
+
+def sweep(price0, nsteps, seeds, widths, workers=None, chunk=256):
+	"""
+	Final values for every (seed, width), shape (len(seeds), len(widths)).
+	workers=None runs in this process; otherwise seeds are split into chunks
+	and backtested across a process pool.
+	"""
+	seeds = list(seeds)
+	if workers is None:
+		return _sweepChunk(price0, nsteps, seeds, widths)
+	with ProcessPoolExecutor(max_workers=workers) as executor:
+		jobs = [executor.submit(_sweepChunk, price0, nsteps, seeds[i:i+chunk], widths)
+				for i in range(0, len(seeds), chunk)]
+		return np.concatenate([job.result() for job in jobs])
+
 if __name__ == '__main__':
-	prices = makePrices(100, 1000)
-	xvals = np.arange(len(prices))
-	mvavgs = movingAvg(prices, 25)
-	plt.plot(xvals, prices)
-	plt.plot(xvals[25:], mvavgs)
-	plt.show()
-	initial, final = doAction(prices, mvavgs, 25)
-	print(initial, final)
+	import argparse
+	parser = argparse.ArgumentParser(description="Moving-average trading toy model")
+	parser.add_argument('--sweep', type=int, default=0, help="Backtest this many seeds instead of plotting one path")
+	parser.add_argument('--widths', type=int, nargs='+', default=[5, 10, 25, 50, 100], help="Moving-average widths to sweep")
+	parser.add_argument('--nsteps', type=int, default=1000, help="Steps per price path (default: 1000)")
+	parser.add_argument('--workers', type=int, default=None, help="Process pool size for the sweep (default: run in-process)")
+	args = parser.parse_args()
+
+	if args.sweep:
+		import time
+		t0 = time.time()
+		finals = sweep(100, args.nsteps, range(args.sweep), args.widths, workers=args.workers)
+		print(f"{finals.size} combinations in {time.time()-t0:.2f}s")
+		for w, col in zip(args.widths, finals.T):
+			print(f"width={w:4d}  mean final={col.mean():8.2f}  min={col.min()}  max={col.max()}")
+	else:
+		import matplotlib.pyplot as plt
+		prices = makePrices(100, args.nsteps)
+		xvals = np.arange(len(prices))
+		mvavgs = movingAvg(prices, 25)
+		plt.plot(xvals, prices)
+		plt.plot(xvals[25:], mvavgs)
+		plt.show()
+		initial, final = doAction(prices, mvavgs, 25)
+		print(initial, final)
@@ -1,12 +1,26 @@
 # master_server.py
 
+import collections
 import socket
 import pickle
 import multiprocessing
-import struct
+import shlex
+import sys
 import time
 import threading
-from multiprocessing import shared_memory, Lock
+from multiprocessing import Lock
+
+from aggregates import count_at_least
+from slot_table import (SHARED_MEM_NAME, DEFAULT_CAPACITY, UDP_WORKER, FLAG_STALE, FLAG_ORPHAN, AGENT_TIMEOUT, STALE_GRACE,
+                        attach_table, create_table, unlink_table, init_table, layout_mismatch, adopt_table, adopt_orphan, clear_orphans,
+                        claim_slot, read_slot, write_slot, set_slot_flags, set_slot_agent, clear_slot, clear_worker_slots,
+                        record_latency, snapshot_slots, snapshot_summary, snapshot_latencies)
+from protocol import pack_message, StreamDecoder
+from capture import CaptureWriter, remove_capture, DATA, CLOSE
+from placement import PlacementService
+from timing_wheel import TimingWheel
+from tracing import STAGES, CLOCK_SYNC_INTERVAL, ClockEstimator, message_times
+from udp_ingest import udp_collector_target
 
 # --- Configuration ---
 # Defaults
@@ -14,69 +28,212 @@ DEFAULT_COLLECTOR_HOST = '0.0.0.0'
 DEFAULT_COLLECTOR_PORT = 13579
 DASHBOARD_HOST = '127.0.0.1'
 DASHBOARD_PORT = 8080
-
-SHARED_MEM_NAME = 'cluster_sentinel_shm'
-MAX_CLIENTS = 10
-# slot_id (int), address (string 64 bytes), cpu (float), ram (float)
-SHARED_MEM_FORMAT = 'i64sff'
-PACKED_DATA_SIZE = struct.calcsize(SHARED_MEM_FORMAT)
-SHARED_MEM_SIZE = PACKED_DATA_SIZE * MAX_CLIENTS
+SUMMARY_THRESHOLD = 80  # Dashboard shows how many agents are at or above this CPU/RAM percent
+SUPERVISE_INTERVAL = 1.0  # Seconds between checks that every collector worker is alive
+LOCK_STUCK_TIMEOUT = 5.0  # Seconds to wait for the lock after a collector died before taking it as stuck
+RESTART_GRACE = 10.0      # A process that dies sooner than this after starting failed at startup
+RESTART_BACKOFF = 1.0     # Seconds before restarting such a process, doubled for each further failure
+MAX_FAST_RESTARTS = 5     # Startup failures in a row after which a process is given up
+RATE_CHECK_INTERVAL = 1.0  # Seconds between ingest rate checks (--max-ingest-rate)
+RATE_WINDOW = 5            # Checks averaged per decision (agents' samples arrive in bursts)
+MIN_RATE_LIMIT = 0.25      # Rate limits (seconds) below this are lifted altogether
+REBIND_GRACE = 30.0        # Seconds adopted slots wait for their agents after a warm restart
 
 
 # --- Collector Process ---
 
-def find_slot(shm):
-    """Finds an empty slot in shared memory."""
-    for i in range(MAX_CLIENTS):
-        offset = i * PACKED_DATA_SIZE
-        slot_id, _, _, _ = struct.unpack(SHARED_MEM_FORMAT, shm.buf[offset:offset + PACKED_DATA_SIZE])
-        if slot_id == 0:
-            return i
-    return None
-
-def handle_client(conn, addr, shm, lock):
+# slot_index -> socket of the agent in that slot, for sending commands
+agent_connections = {}
+# socket -> t0 of the CLOCK command awaiting its reply (latency tracing)
+clock_requests = {}
+connections_lock = threading.Lock()
+
+# Liveness: one timing wheel per collector process instead of a timer per socket.
+# Every message from an agent re-arms its slot's deadline. A missed deadline
+# marks the slot stale; a second one (after STALE_GRACE) closes the connection.
+liveness = TimingWheel()
+stale_slots = set()
+agent_timeouts = {}  # slot_index -> seconds, for agents that announced a long sampling interval
+liveness_lock = threading.Lock()
+
+def touch(shm, lock, slot_index, addr):
+    """Pushes back an agent's deadline; revives the slot if it was stale."""
+    with liveness_lock:
+        liveness.arm(slot_index, agent_timeouts.get(slot_index, AGENT_TIMEOUT))
+        was_stale = slot_index in stale_slots
+        stale_slots.discard(slot_index)
+    if was_stale:
+        with lock:
+            set_slot_flags(shm, slot_index, 0)
+        print(f"[Collector] Client {addr} is reporting again.")
+
+def liveness_monitor(shm, lock, worker):
+    """Advances the wheel: marks agents that missed their deadline stale, then drops them."""
+    while True:
+        time.sleep(liveness.tick)
+        with liveness_lock:
+            expired = liveness.advance()
+            to_mark, to_reap = [], []
+            for slot_index in expired:
+                if slot_index in stale_slots:
+                    stale_slots.discard(slot_index)
+                    to_reap.append(slot_index)
+                else:
+                    stale_slots.add(slot_index)
+                    liveness.arm(slot_index, STALE_GRACE)
+                    to_mark.append(slot_index)
+
+            # Still under liveness_lock: a touch or disconnect cannot slip in between, and a
+            # connection gives up its deadline before its slot is cleared for someone else
+            if to_mark:
+                with lock:
+                    for slot_index in to_mark:
+                        slot_id, _, _, _, slot_worker, *_ = read_slot(shm, slot_index)
+                        if slot_id != 0 and slot_worker == worker:
+                            set_slot_flags(shm, slot_index, FLAG_STALE)
+        for slot_index in to_mark:
+            print(f"[Collector] Client {slot_index + 1} silent for {AGENT_TIMEOUT:.0f}s, marked stale.")
+        for slot_index in to_reap:
+            with connections_lock:
+                conn = agent_connections.get(slot_index)
+            print(f"[Collector] Client {slot_index + 1} stale for {STALE_GRACE:.0f}s, dropping it.")
+            if conn is not None:
+                # Wakes the client thread's recv(), which then frees the slot
+                try:
+                    conn.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+
+def rebind(old_index, new_index, conn):
+    """Moves a connection's bookkeeping to the slot its agent held before a warm restart."""
+    with connections_lock:
+        agent_connections.pop(old_index, None)
+        agent_connections[new_index] = conn
+    with liveness_lock:
+        liveness.cancel(old_index)
+        stale_slots.discard(old_index)
+        timeout = agent_timeouts.pop(old_index, None)
+        if timeout is not None:
+            agent_timeouts[new_index] = timeout
+
+def record_trace(shm, lock, sampled, sent, timing, clock):
+    """Adds a traced sample's stage latencies (see tracing.py) to the shared histograms."""
+    received, decoded, locked, committed = timing
+    with lock:
+        record_latency(shm, 'sample', sent - sampled)
+        if clock.offset is not None:
+            record_latency(shm, 'network', received - clock.to_local(sent))
+        record_latency(shm, 'decode', decoded - received)
+        record_latency(shm, 'lock', locked - decoded)
+        record_latency(shm, 'commit', committed - locked)
+
+def handle_client(conn, addr, shm, lock, worker, capture=None, command_queue=None):
     """Handles a single agent connection."""
     print(f"[Collector] Connected by {addr}")
+    capture_id = capture.new_conn(addr) if capture else None
     # Prepare address string for shared memory
     addr_str = str(addr)
     addr_bytes = addr_str.encode('utf-8')
+    agent_id = b''  # Until the agent sends IDENTIFY
+    clock = ClockEstimator()  # The agent's clock, once it sends traced samples
+    samples = 0
+    timing = None  # (received, decoded, locked, committed) of the latest sample
 
     slot_index = None
     try:
         with lock:
-            slot_index = find_slot(shm)
+            # Claim it right away so an agent in another worker cannot get the same slot
+            slot_index = claim_slot(shm, addr_bytes, worker)
 
         if slot_index is None:
-            print("[Collector] No available slots for new client.")
+            print("[Collector] No available slots for new client (see --slots).")
             return
 
         print(f"[Collector] Client {addr} assigned to slot {slot_index}")
-        offset = slot_index * PACKED_DATA_SIZE
+        with connections_lock:
+            agent_connections[slot_index] = conn
+        push_rate_limit(command_queue, slot_index)
 
-        # Set a timeout. If no data received in 5 seconds, assume dead.
-        conn.settimeout(5.0)
+        # No socket timeout: the liveness monitor drops agents that go quiet
+        touch(shm, lock, slot_index, addr)
+        # Pickled samples by default, compact delta frames once the agent's HELLO asks for them
+        decoder = StreamDecoder()
 
         while True:
             try:
                 data = conn.recv(4096)
+                received = time.monotonic()
                 if not data:
                     break
-
-                stats = pickle.loads(data)
-                print(f"[Collector] Received from {addr}: {stats}")
-
-                cpu = stats.get('cpu', 0.0)
-                ram = stats.get('ram', 0.0)
-
-                with lock:
-                    # slot_index + 1 = Active ID (to avoid 0), addr_bytes, cpu, ram
-                    packed_data = struct.pack(SHARED_MEM_FORMAT, slot_index + 1, addr_bytes, cpu, ram)
-                    shm.buf[offset:offset + PACKED_DATA_SIZE] = packed_data
-
-            except socket.timeout:
-                print(f"[Collector] Client {slot_index+1} at {addr} timed out.")
-                break
-            except (pickle.UnpicklingError, EOFError):
+                if capture:
+                    capture.write(capture_id, DATA, data)
+
+                messages = decoder.feed(data)
+                decoded = time.monotonic()
+                # Heartbeats are what an agent sends instead of samples: counting them would hide a RATE floor's effect
+                count_ingest(sum(1 for stats in messages if stats.get('type') != 'HEARTBEAT'))
+                for stats in messages:
+                    touch(shm, lock, slot_index, addr)
+                    if stats.get('type') == 'HEARTBEAT':
+                        continue
+                    if stats.get('type') == 'INTERVAL':
+                        # Adaptive agent, or one under a RATE floor: may stay quiet for up to max_interval seconds
+                        with liveness_lock:
+                            agent_timeouts[slot_index] = AGENT_TIMEOUT + float(stats.get('max_interval', 0.0))
+                        touch(shm, lock, slot_index, addr)
+                        continue
+                    if stats.get('type') == 'IDENTIFY':
+                        agent_id = str(stats.get('agent_id', '')).encode('utf-8')[:64]
+                        with lock:
+                            # After a warm restart, take back the slot (and stats) of our previous connection
+                            adopted = adopt_orphan(shm, agent_id, addr_bytes, worker)
+                            if adopted is None:
+                                set_slot_agent(shm, slot_index, agent_id)
+                        if adopted is not None:
+                            print(f"[Collector] Client {addr} rebound to its slot {adopted} from before the restart")
+                            # Move the bookkeeping first, so the claimed slot is only freed once nothing here refers to it
+                            rebind(slot_index, adopted, conn)
+                            with lock:
+                                clear_slot(shm, slot_index)
+                            slot_index = adopted
+                            touch(shm, lock, slot_index, addr)
+                            push_rate_limit(command_queue, slot_index)
+                        continue
+                    if stats.get('type') == 'TRACE':
+                        # Follows the traced sample; seq tells it is the one we just wrote
+                        trace = message_times(stats, 'sampled', 'sent')
+                        if timing is not None and stats.get('seq') == samples and trace is not None:
+                            record_trace(shm, lock, *trace, timing, clock)
+                        if command_queue is not None and (clock.last_sync is None or received - clock.last_sync >= CLOCK_SYNC_INTERVAL):
+                            clock.last_sync = received
+                            command_queue.put((slot_index, {"type": "COMMAND", "cmd": "CLOCK"}))
+                        continue
+                    if stats.get('type') == 'CLOCK':
+                        with connections_lock:
+                            t0 = clock_requests.pop(conn, None)
+                        # Only the answer to our outstanding request, with the agent's times present and in order
+                        answer = message_times(stats, 't1', 't2')
+                        if t0 is not None and stats.get('t0') == t0 and answer is not None and answer[0] <= answer[1]:
+                            clock.update(t0, *answer, received)
+                        continue
+                    if stats.get('type') == 'RESPONSE':
+                        print(f"[Collector] Task {stats.get('task_id')} on {addr}: {stats.get('status')} {stats.get('output', '')}")
+                        continue
+                    if stats.get('type') == 'HELLO':
+                        print(f"[Collector] {addr} uses {decoder.encoding} encoding for {len(decoder.fields)} fields")
+                        continue
+                    print(f"[Collector] Received from {addr}: {stats}")
+
+                    cpu = stats.get('cpu', 0.0)
+                    ram = stats.get('ram', 0.0)
+
+                    samples += 1
+                    with lock:
+                        locked = time.monotonic()
+                        committed = write_slot(shm, slot_index, addr_bytes, cpu, ram, worker, 0, agent_id, received)
+                    timing = (received, decoded, locked, committed)
+
+            except (pickle.UnpicklingError, EOFError, ValueError):
                 print(f"[Collector] Could not decode data from {addr}. Raw: {data}")
 
     except ConnectionResetError:
@@ -86,44 +243,212 @@ def handle_client(conn, addr, shm, lock):
     finally:
         # Clear the slot on disconnect
         if slot_index is not None:
+            with connections_lock:
+                agent_connections.pop(slot_index, None)
+                clock_requests.pop(conn, None)
+            with liveness_lock:
+                liveness.cancel(slot_index)
+                stale_slots.discard(slot_index)
+                agent_timeouts.pop(slot_index, None)
             with lock:
-                offset = slot_index * PACKED_DATA_SIZE
-                # 0 = Inactive
-                clear_data = struct.pack(SHARED_MEM_FORMAT, 0, b'', 0.0, 0.0)
-                shm.buf[offset:offset + PACKED_DATA_SIZE] = clear_data
+                clear_slot(shm, slot_index)
             print(f"[Collector] Cleared slot {slot_index}")
 
         print(f"[Collector] Client {addr} disconnected.")
+        if capture:
+            capture.write(capture_id, CLOSE)
         conn.close()
 
 
-def collector_process_target(shm_name, lock, host, port):
-    """Listens for agents and writes data to shared memory."""
-    print("[Collector] Process started.")
-    shm = shared_memory.SharedMemory(name=shm_name)
+def command_dispatcher(command_queue):
+    """
+    Sends commands queued by the master (e.g. placed tasks) to the agent in the
+    given slot, or to every agent of this process if the slot is None. All
+    commands go through here, so two are never interleaved on one socket.
+    """
+    while True:
+        slot_index, command = command_queue.get()
+        if slot_index is None and command.get('cmd') == 'RATE':
+            # The limit for everyone (governor or console): agents connecting from now on get it too
+            rate_limit["min_interval"] = command.get("min_interval", 0.0)
+        with connections_lock:
+            if slot_index is None:
+                targets = list(agent_connections.items())
+            else:
+                targets = [(slot_index, agent_connections.get(slot_index))]
+        clock = command.get('cmd') == 'CLOCK'
+        data = pack_message(command)
+        for target_slot, conn in targets:
+            if conn is None:
+                print(f"[Collector] No agent in slot {target_slot}, dropping command {command}")
+                continue
+            if clock:
+                # Clock offset estimation: stamped as late as possible before sending,
+                # and remembered so the client thread only accepts the matching reply
+                t0 = time.monotonic()
+                data = pack_message(dict(command, t0=t0))
+                with connections_lock:
+                    if agent_connections.get(target_slot) is conn:  # Not disconnected meanwhile
+                        clock_requests[conn] = t0
+            try:
+                conn.sendall(data)
+            except OSError as e:
+                print(f"[Collector] Could not send command to slot {target_slot}: {e}")
+
+
+# Load shedding (--max-ingest-rate): when this process receives more messages
+# per second than allowed, every agent is told a minimum sampling interval
+# (RATE command) that brings ingest to 80% of the limit. Once ingest falls
+# below half the limit, the interval is halved until it is lifted. Decisions
+# use the rate over a window of RATE_WINDOW checks, refilled after each change.
+ingest_lock = threading.Lock()
+ingest_count = 0
+rate_limit = {"min_interval": 0.0}
+
+def count_ingest(n):
+    global ingest_count
+    with ingest_lock:
+        ingest_count += n
+
+def push_rate_limit(command_queue, slot_index):
+    if rate_limit["min_interval"] and command_queue is not None:
+        # Load shedding is on: new agents get the same limit as the others
+        command_queue.put((slot_index, rate_command(rate_limit["min_interval"])))
+
+def rate_command(min_interval):
+    return {"type": "COMMAND", "cmd": "RATE", "min_interval": min_interval}
+
+def rate_governor(command_queue, max_rate, worker):
+    global ingest_count
+    window = collections.deque(maxlen=RATE_WINDOW)
+    while True:
+        time.sleep(RATE_CHECK_INTERVAL)
+        with ingest_lock:
+            window.append(ingest_count)
+            ingest_count = 0
+        if len(window) < RATE_WINDOW:
+            continue
+        rate = sum(window) / (len(window) * RATE_CHECK_INTERVAL)
+        with connections_lock:
+            agents = len(agent_connections)
+        current = rate_limit["min_interval"]
+        target = 0.8 * max_rate
+
+        if rate > max_rate and agents:
+            # Scale the current interval by the overshoot (from 1 sample/s per agent if none yet)
+            new = current * rate / target if current else agents / target
+        elif rate < 0.5 * max_rate and current:
+            new = current / 2 if current / 2 >= MIN_RATE_LIMIT else 0.0
+        else:
+            continue
+        rate_limit["min_interval"] = new
+        window.clear()  # Judge the new limit on fresh samples only
+        command_queue.put((None, rate_command(new)))
+        print(f"[Collector {worker}] Ingest {rate:.0f} msg/s (limit {max_rate:g}): "
+              f"minimum sampling interval {'lifted' if not new else f'{new:.2f}s'} for {agents} agent(s)")
+
+
+def collector_process_target(shm_name, lock, host, port, command_queue, worker=0, reuse_port=False, capture_path=None,
+                             max_ingest_rate=0):
+    """
+    Listens for agents and writes data to shared memory. With reuse_port, several
+    of these processes bind the same port and the kernel spreads new
+    connections across them, so decoding is not limited to one core.
+    With capture_path, all received traffic is also recorded (see capture.py).
+    """
+    print(f"[Collector {worker}] Process started.")
 
     with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
         s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if reuse_port:
+            s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
         try:
             s.bind((host, port))
             s.listen()
-            print(f"[Collector] Listening on {host}:{port}")
+        except OSError as e:
+            # Non-zero exit: the master backs off instead of restarting us right away
+            print(f"[Collector {worker}] Cannot listen on {host}:{port}: {e}")
+            sys.exit(1)
+        print(f"[Collector {worker}] Listening on {host}:{port}")
+
+        shm = attach_table(shm_name)
+        capture = None
+        if capture_path:
+            capture = CaptureWriter(f"{capture_path}.{worker}")
+            print(f"[Collector {worker}] Recording traffic to {capture.path}")
+        threading.Thread(target=command_dispatcher, args=(command_queue,), daemon=True).start()
+        threading.Thread(target=liveness_monitor, args=(shm, lock, worker), daemon=True).start()
+        if max_ingest_rate:
+            threading.Thread(target=rate_governor, args=(command_queue, max_ingest_rate, worker), daemon=True).start()
 
+        try:
             while True:
                 conn, addr = s.accept()
                 # Use threading for better performance with I/O-bound tasks
-                client_thread = threading.Thread(target=handle_client, args=(conn, addr, shm, lock))
+                client_thread = threading.Thread(target=handle_client, args=(conn, addr, shm, lock, worker, capture, command_queue))
                 client_thread.start()
         except Exception as e:
-            print(f"[Collector] Critical Error: {e}")
+            print(f"[Collector {worker}] Critical Error: {e}")
+            sys.exit(1)
 
 
 # --- Dashboard Process ---
 
-def dashboard_process_target(shm_name, lock):
+def latency_panel(latencies):
+    """Per-stage latency histograms of traced samples (see tracing.py)."""
+    rows = ""
+    for stage in STAGES:
+        summary = latencies[stage]
+        if not summary.count:
+            continue
+        # Non-empty buckets as "<upper bound>:<count>"
+        buckets = " ".join(f"&lt;{format_latency((1 << k) / 1e6)}:{n}" for k, n in enumerate(summary.histogram) if n)
+        rows += (f"<tr><td>{stage}</td><td>{summary.count}</td><td>mean {format_latency(summary.mean)}</td>"
+                 f"<td>p50 &lt;{format_latency(summary.p50)}</td><td>p90 &lt;{format_latency(summary.p90)}</td>"
+                 f"<td>p99 &lt;{format_latency(summary.p99)}</td><td>{buckets}</td></tr>")
+    if not rows:
+        return ""
+    return f"""
+                    <h2>Latency (traced samples)</h2>
+                    <table class="summary">{rows}</table>
+                    <hr>
+                    """
+
+def format_latency(seconds):
+    if seconds >= 1:
+        return f"{seconds:.1f}s"
+    if seconds >= 1e-3:
+        return f"{seconds * 1e3:.0f}ms"
+    return f"{seconds * 1e6:.0f}us"
+
+def summary_panel(summary):
+    """Cluster-wide figures from the aggregates the collectors maintain (no table scan)."""
+    if not summary.count:
+        return ""
+    rows = ""
+    for name, metric in (("CPU", summary.cpu), ("RAM", summary.ram)):
+        histogram = " ".join(str(n) for n in metric.histogram)
+        rows += (f"<tr><td>{name}</td><td>mean {metric.mean:.1f}% &plusmn; {metric.std:.1f}</td>"
+                 f"<td>min {metric.min:.1f}%</td><td>max {metric.max:.1f}%</td>"
+                 f"<td>&ge;{SUMMARY_THRESHOLD}%: {count_at_least(metric, SUMMARY_THRESHOLD)}</td>"
+                 f"<td>histogram (10% buckets): {histogram}</td></tr>")
+    return f"""
+                    <h2>{summary.count} agent(s) reporting, {summary.stale} stale</h2>
+                    <table class="summary">{rows}</table>
+                    <hr>
+                    """
+
+
+def dashboard_process_target(shm_name):
     """Runs a simple web server to display stats from shared memory."""
     print("[Dashboard] Process started.")
-    shm = shared_memory.SharedMemory(name=shm_name)
+    shm = attach_table(shm_name)
+    # slot index -> commit time of the sample last shown (render latency). Samples
+    # committed before this process started (a restart) were never waiting for it.
+    try:
+        rendered = {slot.index: slot.committed for slot in snapshot_slots(shm)[1]}
+    except TimeoutError:
+        rendered = {}
 
     with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
         s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
@@ -135,30 +460,34 @@ def dashboard_process_target(shm_name, lock):
             conn, addr = s.accept()
             with conn:
                 clients_html = ""
-                with lock:
-                    for i in range(MAX_CLIENTS):
-                        offset = i * PACKED_DATA_SIZE
-                        packed_data = shm.buf[offset:offset + PACKED_DATA_SIZE]
-                        slot_id, addr_bytes, cpu, ram = struct.unpack(SHARED_MEM_FORMAT, packed_data)
-
-                        if slot_id != 0: # If the slot is active
-                            # Decode bytes to string and strip null padding
-                            client_addr = addr_bytes.decode('utf-8').strip('\x00')
-                            clients_html += f"""
-                            <div class="metric">
-                                <h2>CPU Usage: {cpu:.2f}% (Client {slot_id}: {client_addr})</h2>
-                                <div class="bar-container">
-                                    <div class="bar cpu-bar" style="width: {cpu}%;">{cpu:.2f}%</div>
-                                </div>
-                            </div>
-                            <div class="metric">
-                                <h2>RAM Usage: {ram:.2f}%</h2>
-                                <div class="bar-container">
-                                    <div class="bar ram-bar" style="width: {ram}%;">{ram:.2f}%</div>
-                                </div>
-                            </div>
-                            <hr>
-                            """
+                summary_html = ""
+                try:
+                    # Consistent copy of the table without taking the collectors' lock
+                    _, slots = snapshot_slots(shm)
+                    summary_html = summary_panel(snapshot_summary(shm)) + latency_panel(snapshot_latencies(shm))
+                except TimeoutError as e:
+                    slots = []
+                    clients_html = f"<p>{e}</p>"
+                for slot in slots:
+                    slot_id, client_addr, cpu, ram = slot.slot_id, slot.address, slot.cpu, slot.ram
+                    stale = " [STALE]" if slot.flags & FLAG_STALE else ""
+                    if slot.flags & FLAG_ORPHAN:
+                        stale = " [WAITING FOR RECONNECT]"
+                    clients_html += f"""
+                    <div class="metric">
+                        <h2>CPU Usage: {cpu:.2f}% (Client {slot_id}: {client_addr}){stale}</h2>
+                        <div class="bar-container">
+                            <div class="bar cpu-bar" style="width: {cpu}%;">{cpu:.2f}%</div>
+                        </div>
+                    </div>
+                    <div class="metric">
+                        <h2>RAM Usage: {ram:.2f}%</h2>
+                        <div class="bar-container">
+                            <div class="bar ram-bar" style="width: {ram}%;">{ram:.2f}%</div>
+                        </div>
+                    </div>
+                    <hr>
+                    """
 
                 if not clients_html:
                     clients_html = "<p>No connected agents.</p>"
@@ -179,11 +508,13 @@ def dashboard_process_target(shm_name, lock):
                         .cpu-bar {{ background-color: #ff4500; }}
                         .ram-bar {{ background-color: #1e90ff; }}
                         hr {{ border: 1px solid #333; }}
+                        .summary td {{ padding: 0 10px; }}
                     </style>
                 </head>
                 <body>
                     <div class="container">
                         <h1>Cluster Sentinel Dashboard</h1>
+                        {summary_html}
                         {clients_html}
                         <p style="text-align:center;">Page auto-refreshes every 2 seconds.</p>
                     </div>
@@ -195,6 +526,94 @@ def dashboard_process_target(shm_name, lock):
                 response = f"HTTP/1.1 200 OK\nContent-Type: text/html\nContent-Length: {len(html_content)}\n\n{html_content}"
                 conn.sendall(response.encode('utf-8'))
 
+                # Render stage: commit -> first page showing the sample
+                shown = time.monotonic()
+                for slot in slots:
+                    if slot.committed and rendered.get(slot.index) != slot.committed:
+                        rendered[slot.index] = slot.committed
+                        record_latency(shm, 'render', shown - slot.committed)
+
+# --- Admin Console ---
+
+CONSOLE_HELP = """Commands:
+  run <count> <command...>   Place <count> copies of a task on the least-loaded agents
+  nodes                      Show agents ordered by headroom
+  rate <seconds>             Set every TCP agent's minimum sampling interval (0 lifts it)"""
+
+def admin_console(placement, command_queues):
+    """Reads admin commands from stdin and hands tasks to the placement service."""
+    for line in sys.stdin:
+        try:
+            parts = shlex.split(line)
+        except ValueError as e:
+            print(f"[Console] {e}")
+            continue
+        if not parts:
+            continue
+
+        if parts[0] == 'run' and len(parts) >= 3 and parts[1].isdigit():
+            tasks = [{"argv": parts[2:]} for _ in range(int(parts[1]))]
+            placements = placement.place(tasks)
+            for task_id, slot_index, address in placements:
+                print(f"[Console] Task {task_id} -> Client {slot_index + 1} ({address})")
+            if len(placements) < len(tasks):
+                print(f"[Console] {len(tasks) - len(placements)} task(s) not placed: no agents connected.")
+        elif parts[0] == 'rate' and len(parts) == 2:
+            try:
+                min_interval = float(parts[1])
+            except ValueError:
+                print(CONSOLE_HELP)
+                continue
+            for queue in command_queues:
+                queue.put((None, rate_command(min_interval)))
+            print(f"[Console] Minimum sampling interval set to {min_interval:g}s")
+        elif parts[0] == 'nodes':
+            for slot_index, address, cpu, ram, pending, headroom in placement.snapshot():
+                print(f"[Console] Client {slot_index + 1} ({address}): cpu={cpu:.1f}% ram={ram:.1f}% "
+                      f"pending={pending} headroom={headroom:.1f}")
+        else:
+            print(CONSOLE_HELP)
+
+
+# --- Supervision ---
+
+class Restarts:
+    """
+    Restart pacing for one supervised process. A process that keeps dying
+    right after it starts (port in use, ...) is restarted with exponential
+    backoff, and given up after MAX_FAST_RESTARTS failures in a row.
+    """
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.failures = 0
+        self.not_before = 0.0
+        self.given_up = False
+
+    def start(self):
+        self.started = time.monotonic()
+
+    def died(self):
+        """Records a death. Returns the seconds to wait before the restart, or None to give up."""
+        now = time.monotonic()
+        self.failures = self.failures + 1 if now - self.started < RESTART_GRACE else 0
+        if self.failures >= MAX_FAST_RESTARTS:
+            self.given_up = True
+            return None
+        delay = RESTART_BACKOFF * 2 ** (self.failures - 1) if self.failures else 0.0
+        self.not_before = now + delay
+        return delay
+
+    def due(self):
+        return not self.given_up and time.monotonic() >= self.not_before
+
+
+def death_notice(name, proc, delay):
+    if delay is None:
+        return f"[Master] {name} died (exit code {proc.exitcode}) {MAX_FAST_RESTARTS} times right after starting; giving up on it."
+    return f"[Master] {name} died (exit code {proc.exitcode}), restarting it" + (f" in {delay:.0f}s." if delay else ".")
+
+
 # --- Main Application ---
 
 if __name__ == "__main__":
@@ -203,61 +622,173 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Cluster Sentinel Master Server")
     parser.add_argument('--host', type=str, default=DEFAULT_COLLECTOR_HOST, help="Collector bind host (default: 0.0.0.0)")
     parser.add_argument('--port', type=int, default=DEFAULT_COLLECTOR_PORT, help="Collector bind port (default: 13579)")
+    parser.add_argument('--slots', type=int, default=DEFAULT_CAPACITY,
+                        help=f"Agents the slot table holds; more are refused (default: {DEFAULT_CAPACITY})")
+    parser.add_argument('--workers', type=int, default=1, help="Collector processes sharing the port via SO_REUSEPORT (default: 1)")
+    parser.add_argument('--udp', action='store_true', help="Also accept agents using --transport udp on the same port number")
+    parser.add_argument('--max-ingest-rate', type=float, default=0, metavar='MSGS',
+                        help="Messages per second per collector process before agents are told to slow down (default: off)")
+    parser.add_argument('--capture', type=str, default=None, metavar='PATH',
+                        help="Record all agent traffic to PATH.<worker> (and PATH.udp) for replay.py, replacing an earlier capture to PATH")
+    parser.add_argument('--warm-restart', action='store_true',
+                        help="Re-adopt the slot table left by the previous master (if its layout matches) and leave it behind on exit")
     args = parser.parse_args()
+    if args.slots < 1:
+        parser.error("--slots must be at least 1")
 
     shm = None
     shm_created = False
+    orphans_deadline = None
     try:
-        # Clean up old segment first
+        lock = Lock()
+
+        # An existing segment is either adopted (--warm-restart, same layout) or unlinked
         try:
-            # Attempt to link to an existing segment to unlink it
-            existing_shm = shared_memory.SharedMemory(name=SHARED_MEM_NAME)
-            existing_shm.close()
-            existing_shm.unlink()
-            print(f"Unlinked stale shared memory segment '{SHARED_MEM_NAME}'.")
+            existing_shm = attach_table(SHARED_MEM_NAME)
+            reason = layout_mismatch(existing_shm, args.slots) if args.warm_restart else "no --warm-restart"
+            if reason is None:
+                shm = existing_shm
+                with lock:
+                    adopted = adopt_table(shm)
+                orphans_deadline = time.monotonic() + REBIND_GRACE
+                print(f"Adopted shared memory segment '{SHARED_MEM_NAME}' with {len(adopted)} agent(s) "
+                      f"waiting up to {REBIND_GRACE:.0f}s to reconnect.")
+            else:
+                existing_shm.close()
+                unlink_table(SHARED_MEM_NAME)
+                print(f"Unlinked stale shared memory segment '{SHARED_MEM_NAME}' ({reason}).")
         except FileNotFoundError:
             pass  # This is the normal case, nothing to do
 
-        # Create shared memory and a lock
-        shm = shared_memory.SharedMemory(name=SHARED_MEM_NAME, create=True, size=SHARED_MEM_SIZE)
-        shm_created = True
-        print(f"Created shared memory segment '{SHARED_MEM_NAME}' of size {SHARED_MEM_SIZE} bytes.")
-
-        lock = Lock()
-
-        # Initialize shared memory with zeros
-        with lock:
-            initial_data = struct.pack(SHARED_MEM_FORMAT, 0, b'', 0.0, 0.0)
-            for i in range(MAX_CLIENTS):
-                offset = i * PACKED_DATA_SIZE
-                shm.buf[offset:offset + PACKED_DATA_SIZE] = initial_data
-
-        # Create and start processes
-        collector = multiprocessing.Process(target=collector_process_target, args=(SHARED_MEM_NAME, lock, args.host, args.port))
-        dashboard = multiprocessing.Process(target=dashboard_process_target, args=(SHARED_MEM_NAME, lock))
-
-        collector.start()
-        dashboard.start()
-
-        # Wait for processes to finish (they won't, in this case, until interrupted)
-        collector.join()
-        dashboard.join()
+        if shm is None:
+            # Cold start
+            shm = create_table(SHARED_MEM_NAME, args.slots)
+            shm_created = True
+            print(f"Created shared memory segment '{SHARED_MEM_NAME}' of size {shm.size} bytes for {args.slots} agents.")
+            with lock:
+                init_table(shm, args.slots)
+
+        if args.capture:
+            # Restarted collectors add PATH.<worker>.<n>; they must not mix with an earlier run's files
+            removed = remove_capture(args.capture)
+            if removed:
+                print(f"Removed {removed} file(s) of an earlier capture to {args.capture}.")
+
+        # (slot_index, command) pairs for each collector worker to send to its agents
+        command_queues = [multiprocessing.Queue() for _ in range(args.workers)]
+        reuse_port = args.workers > 1
+
+        def start_collector(worker):
+            proc = multiprocessing.Process(target=collector_process_target,
+                                           args=(SHARED_MEM_NAME, lock, args.host, args.port, command_queues[worker], worker, reuse_port,
+                                                 args.capture, args.max_ingest_rate))
+            proc.start()
+            return proc
+
+        def start_udp_collector():
+            proc = multiprocessing.Process(target=udp_collector_target,
+                                           args=(SHARED_MEM_NAME, lock, args.host, args.port, args.capture))
+            proc.start()
+            return proc
+
+        def start_dashboard():
+            proc = multiprocessing.Process(target=dashboard_process_target, args=(SHARED_MEM_NAME,))
+            proc.start()
+            return proc
+
+        # Create and start processes (None: waiting for a restart, or given up)
+        collectors = [start_collector(worker) for worker in range(args.workers)]
+        udp_collector = start_udp_collector() if args.udp else None
+        dashboard = start_dashboard()
+        restarts = {key: Restarts() for key in list(range(args.workers)) + [UDP_WORKER, 'dashboard']}
+
+        placement = PlacementService(shm, command_queues)
+        placement.start()
+        threading.Thread(target=admin_console, args=(placement, command_queues), daemon=True).start()
+
+        # Supervise the processes (they never exit on their own until interrupted)
+        while True:
+            time.sleep(SUPERVISE_INTERVAL)
+            crashed = []
+            for worker, proc in enumerate(collectors):
+                if proc is not None and not proc.is_alive():
+                    print(death_notice(f"Collector {worker}", proc, restarts[worker].died()))
+                    crashed.append(worker)
+                    collectors[worker] = None
+            if udp_collector is not None and not udp_collector.is_alive():
+                print(death_notice("UDP collector", udp_collector, restarts[UDP_WORKER].died()))
+                crashed.append(UDP_WORKER)
+                udp_collector = None
+            if crashed:
+                # Their agents lost their connections (UDP agents keep sending and get
+                # new slots); free their slots for the reconnects. A collector killed
+                # inside the lock leaves it held, so don't wait forever.
+                cleared_workers = crashed
+                if not lock.acquire(timeout=LOCK_STUCK_TIMEOUT):
+                    # Every other collector blocks on it sooner or later: stop them all
+                    # and start over with a new lock
+                    print("[Master] Shared memory lock is stuck; restarting all collectors with a new lock.")
+                    for worker, proc in enumerate(collectors):
+                        if proc is not None:
+                            proc.terminate()
+                            proc.join()
+                            collectors[worker] = None
+                            cleared_workers.append(worker)
+                    if udp_collector is not None:
+                        udp_collector.terminate()
+                        udp_collector.join()
+                        udp_collector = None
+                        cleared_workers.append(UDP_WORKER)
+                    lock = Lock()
+                    lock.acquire()
+                try:
+                    cleared = {worker: clear_worker_slots(shm, worker) for worker in cleared_workers}
+                finally:
+                    lock.release()
+                for worker in cleared_workers:
+                    print(f"[Master] Cleared slots {cleared[worker]} of collector {worker}.")
+
+            for worker, proc in enumerate(collectors):
+                if proc is None and restarts[worker].due():
+                    # A process killed in command_queue.get() can leave the queue's own lock held
+                    command_queues[worker] = multiprocessing.Queue()
+                    collectors[worker] = start_collector(worker)
+                    restarts[worker].start()
+            if args.udp and udp_collector is None and restarts[UDP_WORKER].due():
+                udp_collector = start_udp_collector()
+                restarts[UDP_WORKER].start()
+            if dashboard is not None and not dashboard.is_alive():
+                print(death_notice("Dashboard", dashboard, restarts['dashboard'].died()))
+                dashboard = None
+            if dashboard is None and restarts['dashboard'].due():
+                dashboard = start_dashboard()
+                restarts['dashboard'].start()
+            if orphans_deadline is not None and time.monotonic() >= orphans_deadline:
+                # Agents that did not reconnect after the warm restart are gone
+                orphans_deadline = None
+                with lock:
+                    cleared = clear_orphans(shm)
+                if cleared:
+                    print(f"[Master] Cleared slots {cleared}: their agents did not reconnect after the restart.")
 
     except KeyboardInterrupt:
         print("\nCaught KeyboardInterrupt, shutting down.")
     finally:
         # Clean up processes and shared memory
-        if 'collector' in locals() and collector.is_alive():
-            collector.terminate()
-            collector.join()
-        if 'dashboard' in locals() and dashboard.is_alive():
+        for proc in locals().get('collectors', []) + [locals().get('udp_collector')]:
+            if proc is not None and proc.is_alive():
+                proc.terminate()
+                proc.join()
+        if locals().get('dashboard') is not None and dashboard.is_alive():
             dashboard.terminate()
             dashboard.join()
 
         if shm:
             shm.close()
-            if shm_created:
-                shm.unlink()
+            if args.warm_restart:
+                print(f"Left shared memory '{SHARED_MEM_NAME}' for the next master (--warm-restart).")
+            elif shm_created:
+                unlink_table(SHARED_MEM_NAME)
                 print(f"Unlinked shared memory '{SHARED_MEM_NAME}'.")
 
         print("Shutdown complete.")
@@ -0,0 +1,147 @@
+# placement.py
+#
+# Load-aware task placement for the master server.
+#
+# The collector already keeps every agent's live CPU/RAM in the shared-memory
+# slot table. PlacementService polls that table (lock-free, through its
+# seqlock) and keeps a heap of nodes ordered by headroom (the free share of the
+# scarcer resource), so each task goes to the least-loaded agent instead of
+# blindly. Placed tasks count as projected load on
+# their node for a while, until the node's own samples have had time to show it.
+# Chosen tasks are handed to the collector process that owns the agent's
+# connection through its command queue, as (slot_index, command).
+
+import heapq
+import itertools
+import threading
+import time
+
+from slot_table import UDP_WORKER, FLAG_STALE, snapshot_slots
+
+DEFAULT_TASK_CPU = 25.0  # Projected CPU% of a task with no estimate of its own
+PENDING_TTL = 10.0       # Seconds a placement counts as projected load
+REFRESH_INTERVAL = 0.5   # Seconds between slot table polls
+
+
+class NodeState:
+    __slots__ = ('slot_index', 'address', 'worker', 'cpu', 'ram', 'pending', 'version')
+
+    def __init__(self, slot_index, address, worker):
+        self.slot_index = slot_index
+        self.address = address
+        self.worker = worker
+        self.cpu = 0.0
+        self.ram = 0.0
+        self.pending = []  # (expiry, projected cpu) of recently placed tasks
+        self.version = 0
+
+    def expire(self, now):
+        """Drops placements older than PENDING_TTL. Returns True if any were dropped."""
+        before = len(self.pending)
+        self.pending = [p for p in self.pending if p[0] > now]
+        return len(self.pending) != before
+
+    def headroom(self):
+        cpu = self.cpu + sum(load for _, load in self.pending)
+        return min(100.0 - cpu, 100.0 - self.ram)
+
+
+class PlacementService:
+    """Places tasks on the agents with the most headroom."""
+
+    def __init__(self, shm, command_queues):
+        self.shm = shm
+        self.command_queues = command_queues  # One per collector worker
+        self.nodes = {}  # slot_index -> NodeState
+        # Entries are (-headroom, tiebreak, slot_index, version). Superseded
+        # entries stay in the heap and are skipped when popped (lazy deletion).
+        self._heap = []
+        self._tiebreak = itertools.count()
+        self._task_ids = itertools.count(1)
+        self._mutex = threading.Lock()
+
+    def _push(self, node):
+        node.version += 1
+        heapq.heappush(self._heap, (-node.headroom(), next(self._tiebreak), node.slot_index, node.version))
+
+    def refresh(self):
+        """Re-reads the slot table and re-prioritizes every node whose load changed."""
+        _, snapshot = snapshot_slots(self.shm)
+        now = time.monotonic()
+
+        with self._mutex:
+            seen = set()
+            for slot in snapshot:
+                if slot.worker == UDP_WORKER or slot.flags & FLAG_STALE:
+                    continue  # UDP agents report only; stale agents may be gone
+                seen.add(slot.index)
+                node = self.nodes.get(slot.index)
+                if node is None or node.address != slot.address or node.worker != slot.worker:
+                    # New agent (or a new agent reusing the slot)
+                    node = NodeState(slot.index, slot.address, slot.worker)
+                    self.nodes[slot.index] = node
+                elif node.cpu == slot.cpu and node.ram == slot.ram and not node.expire(now):
+                    continue
+                node.cpu, node.ram = slot.cpu, slot.ram
+                node.expire(now)
+                self._push(node)
+
+            for slot_index in list(self.nodes):
+                if slot_index not in seen:
+                    del self.nodes[slot_index]
+
+            # Keep the lazily-deleted entries from piling up
+            if len(self._heap) > 4 * len(self.nodes) + 64:
+                self._heap = []
+                for node in self.nodes.values():
+                    self._push(node)
+
+    def _pop_best(self):
+        while self._heap:
+            _, _, slot_index, version = heapq.heappop(self._heap)
+            node = self.nodes.get(slot_index)
+            if node is not None and node.version == version:
+                return node
+        return None
+
+    def place(self, tasks):
+        """
+        Places a batch of tasks, each a dict {'argv': [...], 'cpu': projected cpu%}.
+        Returns [(task_id, slot_index, address)] for the tasks that were placed;
+        the list is shorter than `tasks` only if no agent is connected.
+        """
+        self.refresh()
+        placements = []
+        with self._mutex:
+            now = time.monotonic()
+            for task in tasks:
+                node = self._pop_best()
+                if node is None:
+                    break
+                node.pending.append((now + PENDING_TTL, task.get('cpu', DEFAULT_TASK_CPU)))
+                self._push(node)
+
+                task_id = next(self._task_ids)
+                command = {"type": "COMMAND", "cmd": "EXECUTE", "task_id": task_id, "args": list(task['argv'])}
+                self.command_queues[node.worker].put((node.slot_index, command))
+                placements.append((task_id, node.slot_index, node.address))
+        return placements
+
+    def snapshot(self):
+        """[(slot_index, address, cpu, ram, pending tasks, headroom)], most headroom first."""
+        with self._mutex:
+            rows = [(n.slot_index, n.address, n.cpu, n.ram, len(n.pending), n.headroom()) for n in self.nodes.values()]
+        return sorted(rows, key=lambda row: -row[-1])
+
+    def run(self):
+        while True:
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"[Placement] Refresh failed: {e}")
+            time.sleep(REFRESH_INTERVAL)
+
+    def start(self):
+        thread = threading.Thread(target=self.run, daemon=True)
+        thread.start()
+        return thread
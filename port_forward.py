@@ -1,7 +1,270 @@
 import socket
+import struct
 import threading
+import queue
 import argparse
+import itertools
 import sys
+import time
+
+# --- Multiplexing (--mux / --demux) ---
+#
+# Without these modes every agent gets its own connection through the bridge
+# and the SSH tunnel. With --mux the bridge carries all agent streams over a
+# few persistent upstream connections, as frames:
+#
+#     frame = stream_id(uint32) type(uint8) length(uint32) payload
+#
+# OPEN starts a stream (payload: the agent's address), DATA carries bytes,
+# CLOSE ends it, in either direction. A --demux bridge beside the collector
+# turns each stream back into a local connection to the collector.
+#
+#   login node : python port_forward.py --mux --local-port 13580 --remote-port 13579
+#   master     : python port_forward.py --demux --local-port 13579 --remote-port 13578
+#                python master_server.py --port 13578
+
+FRAME_HEADER = struct.Struct('!IBI')
+OPEN, DATA, CLOSE = 1, 2, 3
+RECONNECT_DELAY = 1.0       # Seconds before the first upstream reconnect attempt
+MAX_RECONNECT_DELAY = 30.0
+MAX_PENDING = 1024          # Frames queued for one stream's local end before the stream is dropped
+
+
+def recv_exact(sock, n):
+    buf = bytearray()
+    while len(buf) < n:
+        chunk = sock.recv(n - len(buf))
+        if not chunk:
+            raise ConnectionError("Connection closed")
+        buf += chunk
+    return bytes(buf)
+
+
+def read_frames(sock):
+    """Yields (stream_id, type, payload) until the connection closes."""
+    while True:
+        stream_id, frame_type, length = FRAME_HEADER.unpack(recv_exact(sock, FRAME_HEADER.size))
+        yield stream_id, frame_type, recv_exact(sock, length) if length else b''
+
+
+class Stream:
+    """
+    The local end of one stream. Frames for it are queued and written by its
+    own thread, so a slow or stuck agent (or collector) cannot hold up the
+    other streams on the same upstream connection.
+    """
+
+    def __init__(self, sock=None):
+        self.sock = sock  # None until the demux side has connected it
+        self.pending = queue.Queue(MAX_PENDING)  # Payloads; None ends the stream
+
+    def deliver(self, payload):
+        try:
+            self.pending.put_nowait(payload)
+        except queue.Full:
+            # Not keeping up: drop the stream rather than buffer without bound
+            self.shutdown()
+
+    def finish(self):
+        """Ends the stream once the frames already queued are written."""
+        try:
+            self.pending.put_nowait(None)
+        except queue.Full:
+            self.shutdown()
+
+    def shutdown(self):
+        """Unblocks the stream's threads; its pump thread closes the socket."""
+        if self.sock is not None:
+            try:
+                self.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def write(self):
+        """Writer thread: sends the queued payloads to the local socket."""
+        while True:
+            payload = self.pending.get()
+            if payload is None:
+                break
+            try:
+                self.sock.sendall(payload)
+            except OSError:
+                break  # Local side is gone; its pump thread sends the CLOSE
+        self.shutdown()
+
+
+class Upstream:
+    """One multiplexed connection. Frames from several threads are sent whole under a lock."""
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.send_lock = threading.Lock()
+        self.streams = {}  # stream_id -> Stream
+        self.streams_lock = threading.Lock()
+
+    def send(self, stream_id, frame_type, payload=b''):
+        with self.send_lock:
+            self.sock.sendall(FRAME_HEADER.pack(stream_id, frame_type, len(payload)) + payload)
+
+    def add(self, stream_id, stream):
+        with self.streams_lock:
+            self.streams[stream_id] = stream
+
+    def remove(self, stream_id):
+        with self.streams_lock:
+            return self.streams.pop(stream_id, None)
+
+    def close_all(self):
+        with self.streams_lock:
+            streams, self.streams = list(self.streams.values()), {}
+        for stream in streams:
+            stream.shutdown()
+        self.sock.close()
+
+
+def pump_to_upstream(stream, upstream, stream_id):
+    """Sends everything read from a stream's local socket as DATA frames, then CLOSE."""
+    local = stream.sock
+    try:
+        while True:
+            data = local.recv(65536)
+            if not data:
+                break
+            upstream.send(stream_id, DATA, data)
+    except OSError:
+        pass
+    finally:
+        if upstream.remove(stream_id) is not None:
+            # Not already closed from the other side: tell it
+            try:
+                upstream.send(stream_id, CLOSE)
+            except OSError:
+                pass
+        stream.finish()  # Lets the writer thread exit
+        local.close()
+
+
+def dispatch_frames(upstream, on_open=None):
+    """Hands DATA and CLOSE frames to the streams' writer threads (and OPEN to on_open, on the demux side)."""
+    try:
+        for stream_id, frame_type, payload in read_frames(upstream.sock):
+            if frame_type == OPEN and on_open is not None:
+                on_open(upstream, stream_id, payload)
+                continue
+            with upstream.streams_lock:
+                stream = upstream.streams.get(stream_id)
+            if stream is None:
+                continue  # Stream already closed here
+            if frame_type == DATA:
+                stream.deliver(payload)
+            elif frame_type == CLOSE:
+                upstream.remove(stream_id)
+                stream.finish()
+    except (ConnectionError, OSError):
+        pass
+    finally:
+        upstream.close_all()
+
+
+class Mux:
+    """Bridge side: accepts agents locally and carries them over `count` upstream connections."""
+
+    def __init__(self, target_host, target_port, count):
+        self.target = (target_host, target_port)
+        self.upstreams = [None] * count
+        self.ready = threading.Condition()
+        self.stream_ids = itertools.count(1)
+        for i in range(count):
+            threading.Thread(target=self.maintain, args=(i,), daemon=True).start()
+
+    def maintain(self, i):
+        """Keeps upstream connection i open, reconnecting with backoff."""
+        delay = RECONNECT_DELAY
+        while True:
+            try:
+                sock = socket.create_connection(self.target)
+            except OSError as e:
+                print(f"[!] Upstream {i} to {self.target[0]}:{self.target[1]} failed: {e}. Retrying in {delay:.0f}s")
+                time.sleep(delay)
+                delay = min(delay * 2, MAX_RECONNECT_DELAY)
+                continue
+            delay = RECONNECT_DELAY
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            upstream = Upstream(sock)
+            with self.ready:
+                self.upstreams[i] = upstream
+                self.ready.notify_all()
+            print(f"[*] Upstream {i} connected to {self.target[0]}:{self.target[1]}")
+            dispatch_frames(upstream)  # Returns when the connection drops; its agents reconnect
+            with self.ready:
+                self.upstreams[i] = None
+            print(f"[!] Upstream {i} lost, {RECONNECT_DELAY:.0f}s until reconnect")
+            time.sleep(RECONNECT_DELAY)
+
+    def pick(self, timeout=10.0):
+        """The live upstream carrying the fewest streams (waits for one during a reconnect)."""
+        with self.ready:
+            self.ready.wait_for(lambda: any(self.upstreams), timeout)
+            live = [u for u in self.upstreams if u is not None]
+        return min(live, key=lambda u: len(u.streams)) if live else None
+
+    def handle_client(self, client_socket, addr):
+        upstream = self.pick()
+        if upstream is None:
+            print(f"[!] No upstream connection; dropping {addr[0]}:{addr[1]}")
+            client_socket.close()
+            return
+        stream_id = next(self.stream_ids)
+        stream = Stream(client_socket)
+        upstream.add(stream_id, stream)
+        try:
+            upstream.send(stream_id, OPEN, f"{addr[0]}:{addr[1]}".encode())
+        except OSError:
+            upstream.remove(stream_id)
+            client_socket.close()
+            return
+        threading.Thread(target=stream.write, daemon=True).start()
+        pump_to_upstream(stream, upstream, stream_id)
+
+
+def demux_open(target_host, target_port):
+    """
+    Returns the OPEN handler of a demux bridge: one local connection per
+    stream. The stream is registered at once, so DATA frames arriving while
+    it connects are queued, and the connection is made in the stream's own
+    thread so a slow connect does not hold up the other streams.
+    """
+    def connect(upstream, stream_id, stream, origin):
+        try:
+            local = socket.create_connection((target_host, target_port))
+        except OSError as e:
+            print(f"[!] Stream {stream_id} from {origin}: cannot reach {target_host}:{target_port}: {e}")
+            if upstream.remove(stream_id) is not None:
+                try:
+                    upstream.send(stream_id, CLOSE)
+                except OSError:
+                    pass
+            return
+        with upstream.streams_lock:
+            if upstream.streams.get(stream_id) is not stream:
+                local.close()  # Closed from the other side (or the upstream dropped) meanwhile
+                return
+            stream.sock = local
+        threading.Thread(target=pump_to_upstream, args=(stream, upstream, stream_id), daemon=True).start()
+        stream.write()
+
+    def on_open(upstream, stream_id, payload):
+        stream = Stream()
+        upstream.add(stream_id, stream)
+        threading.Thread(target=connect, args=(upstream, stream_id, stream, payload.decode(errors='replace')), daemon=True).start()
+    return on_open
+
+
+def handle_upstream(sock, addr, target_host, target_port):
+    print(f"[*] Mux bridge connected from {addr[0]}:{addr[1]}")
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    dispatch_frames(Upstream(sock), demux_open(target_host, target_port))
+    print(f"[*] Mux bridge {addr[0]}:{addr[1]} disconnected")
 
 def forward(source, destination, description):
     try:
@@ -45,6 +308,10 @@ if __name__ == "__main__":
     parser.add_argument('--local-port', type=int, default=13580, help="Public port to listen on (e.g., 13580)")
     # The port the SSH Tunnel is listening on (13579)
     parser.add_argument('--remote-port', type=int, default=13579, help="Target port (SSH Tunnel end, e.g., 13579)")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('--mux', action='store_true', help="Carry all agent connections over a few upstream connections to a --demux bridge")
+    mode.add_argument('--demux', action='store_true', help="Accept --mux bridges and open one local connection per agent stream")
+    parser.add_argument('--upstreams', type=int, default=1, help="Upstream connections in --mux mode (default: 1)")
 
     args = parser.parse_args()
 
@@ -58,13 +325,20 @@ if __name__ == "__main__":
         server.bind((BIND_HOST, args.local_port))
         server.listen(10)
         print(f"[*] Bridge Active: Listening on {BIND_HOST}:{args.local_port}")
-        print(f"[*] Forwarding to: {TARGET_HOST}:{args.remote_port}")
+        print(f"[*] Forwarding to: {TARGET_HOST}:{args.remote_port}" + (" (multiplexed)" if args.mux else ""))
         print("[*] Ready for connections...")
 
+        mux = Mux(TARGET_HOST, args.remote_port, args.upstreams) if args.mux else None
         while True:
             client_socket, addr = server.accept()
+            if args.demux:
+                threading.Thread(target=handle_upstream, args=(client_socket, addr, TARGET_HOST, args.remote_port), daemon=True).start()
+                continue
             print(f"[*] Incoming connection from {addr[0]}:{addr[1]}")
-            threading.Thread(target=handle_client, args=(client_socket, TARGET_HOST, args.remote_port)).start()
+            if mux:
+                threading.Thread(target=mux.handle_client, args=(client_socket, addr), daemon=True).start()
+            else:
+                threading.Thread(target=handle_client, args=(client_socket, TARGET_HOST, args.remote_port)).start()
 
     except KeyboardInterrupt:
         print("\n[*] Shutting down bridge.")
@@ -0,0 +1,304 @@
+# protocol.py
+#
+# Message framing shared by agent.py and master_server.py.
+#
+# Commands from the master to an agent are pickled dicts (see docs/next_step.md)
+# sent with a 4-byte length prefix, so several commands arriving in one recv()
+# (or one command split over two) are still decoded correctly.
+#
+# Agent -> master traffic has two encodings:
+#
+# * pickle (default): every sample is a pickled dict, back to back.
+# * delta: the agent first sends a pickled HELLO naming the fields and the
+#   fixed-point scale, then only compact binary frames:
+#
+#     frame    = varint(length) type body
+#     KEYFRAME : zigzag varint of every field, as round(value * scale)
+#     DELTA    : bitmap of changed fields, then zigzag varint (new - previous)
+#                for each changed field, in fixed-point units
+#     PICKLE   : any other message (task responses, a new HELLO) as a pickle
+#
+#   A keyframe is sent every KEYFRAME_INTERVAL frames so the receiver can
+#   always resynchronize. A sample with unchanged values costs 3-4 bytes.
+#
+# UDP agents (udp_ingest.py) send one self-describing datagram per sample:
+#
+#     datagram = "CS" version(1) seq(uint32) id_len(1) agent_id count(1)
+#                count * (name_len(1) name value(float64))
+
+import io
+import pickle
+import struct
+
+LENGTH_PREFIX = struct.Struct('!I')
+
+FRAME_KEYFRAME = 1
+FRAME_DELTA = 2
+FRAME_PICKLE = 3
+
+DATAGRAM_MAGIC = b'CS'
+DATAGRAM_VERSION = 1
+DATAGRAM_HEADER = struct.Struct('!2sBI')
+DATAGRAM_VALUE = struct.Struct('!d')
+
+DEFAULT_SCALE = 10        # Fixed-point resolution: 0.1 (psutil reports percents to 0.1)
+KEYFRAME_INTERVAL = 30    # Frames between keyframes
+
+
+def pack_message(msg):
+    data = pickle.dumps(msg)
+    return LENGTH_PREFIX.pack(len(data)) + data
+
+
+class MessageBuffer:
+    """Accumulates received bytes and returns every complete message."""
+
+    def __init__(self):
+        self._buf = bytearray()
+
+    def feed(self, data):
+        self._buf += data
+        messages = []
+        while len(self._buf) >= LENGTH_PREFIX.size:
+            (length,) = LENGTH_PREFIX.unpack_from(self._buf)
+            end = LENGTH_PREFIX.size + length
+            if len(self._buf) < end:
+                break
+            messages.append(pickle.loads(self._buf[LENGTH_PREFIX.size:end]))
+            del self._buf[:end]
+        return messages
+
+
+def pack_datagram(agent_id, seq, stats):
+    """One UDP datagram for a sample: agent id, sequence number, then name/value pairs."""
+    out = bytearray(DATAGRAM_HEADER.pack(DATAGRAM_MAGIC, DATAGRAM_VERSION, seq % (1 << 32)))
+    agent = agent_id.encode('utf-8')
+    out.append(len(agent))
+    out += agent
+    out.append(len(stats))
+    for name, value in stats.items():
+        key = name.encode('utf-8')
+        out.append(len(key))
+        out += key
+        out += DATAGRAM_VALUE.pack(value)
+    return bytes(out)
+
+
+def unpack_datagram(data):
+    """Returns (agent_id, seq, stats). Raises ValueError for a malformed datagram."""
+    try:
+        magic, version, seq = DATAGRAM_HEADER.unpack_from(data)
+        if magic != DATAGRAM_MAGIC or version != DATAGRAM_VERSION:
+            raise ValueError(f"Not a version {DATAGRAM_VERSION} metrics datagram")
+        pos = DATAGRAM_HEADER.size
+        agent_id = data[pos + 1:pos + 1 + data[pos]].decode('utf-8')
+        pos += 1 + data[pos]
+        count = data[pos]
+        pos += 1
+        stats = {}
+        for _ in range(count):
+            name = data[pos + 1:pos + 1 + data[pos]].decode('utf-8')
+            pos += 1 + data[pos]
+            (stats[name],) = DATAGRAM_VALUE.unpack_from(data, pos)
+            pos += DATAGRAM_VALUE.size
+    except (struct.error, IndexError, UnicodeDecodeError) as e:
+        raise ValueError(f"Malformed datagram: {e}") from None
+    return agent_id, seq, stats
+
+
+# --- Varints ---
+
+def encode_varint(value, out):
+    """Appends an unsigned LEB128 varint to the bytearray `out`."""
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def decode_varint(data, pos):
+    """Returns (value, next position), or (None, pos) if the varint is incomplete."""
+    value = shift = 0
+    while pos < len(data):
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+    return None, pos
+
+
+def zigzag(value):
+    return value * 2 if value >= 0 else -value * 2 - 1
+
+
+def unzigzag(value):
+    return value >> 1 if not value & 1 else -((value + 1) >> 1)
+
+
+# --- Agent side ---
+
+class PickleEncoder:
+    """The original encoding: one pickled dict per message."""
+
+    def start(self):
+        return b''
+
+    def encode(self, stats):
+        return pickle.dumps(stats)
+
+    def encode_message(self, msg):
+        return pickle.dumps(msg)
+
+
+class DeltaEncoder:
+    """
+    Encodes samples as fixed-point deltas against the previous sample. The
+    schema (field names) is taken from the first sample and renegotiated
+    automatically if the set of fields changes.
+    """
+
+    def __init__(self, scale=DEFAULT_SCALE, keyframe_interval=KEYFRAME_INTERVAL):
+        self.scale = scale
+        self.keyframe_interval = keyframe_interval
+        self.fields = None
+        self._values = None
+        self._since_keyframe = 0
+
+    def _hello(self):
+        return {"type": "HELLO", "encoding": "delta", "fields": list(self.fields), "scale": self.scale}
+
+    def start(self):
+        """Bytes to send first on a new connection (empty until the schema is known)."""
+        self._values = None
+        return pickle.dumps(self._hello()) if self.fields is not None else b''
+
+    def _frame(self, body):
+        out = bytearray()
+        encode_varint(len(body), out)
+        return bytes(out + body)
+
+    def encode_message(self, msg):
+        if self.fields is None:
+            return pickle.dumps(msg)  # No HELLO sent yet: the receiver still expects pickles
+        return self._frame(bytes([FRAME_PICKLE]) + pickle.dumps(msg))
+
+    def encode(self, stats):
+        prefix = b''
+        if self.fields is None:
+            # First sample on this connection: negotiate the schema in pickle mode
+            self.fields = tuple(stats)
+            prefix = pickle.dumps(self._hello())
+            self._values = None
+        elif tuple(stats) != self.fields:
+            self.fields = tuple(stats)
+            prefix = self.encode_message(self._hello())
+            self._values = None
+
+        values = [round(stats[name] * self.scale) for name in self.fields]
+        body = bytearray()
+        if self._values is None or self._since_keyframe >= self.keyframe_interval:
+            body.append(FRAME_KEYFRAME)
+            for value in values:
+                encode_varint(zigzag(value), body)
+            self._since_keyframe = 0
+        else:
+            body.append(FRAME_DELTA)
+            bitmap = bytearray((len(values) + 7) // 8)
+            deltas = bytearray()
+            for i, (value, previous) in enumerate(zip(values, self._values)):
+                if value != previous:
+                    bitmap[i // 8] |= 1 << (i % 8)
+                    encode_varint(zigzag(value - previous), deltas)
+            body += bitmap + deltas
+            self._since_keyframe += 1
+        self._values = values
+        return prefix + self._frame(body)
+
+
+# --- Collector side ---
+
+class StreamDecoder:
+    """
+    Decodes one agent connection. Starts with the pickle encoding and switches
+    to binary frames when the agent's HELLO asks for the delta encoding.
+    feed() returns every complete message as a dict (samples with float values).
+    """
+
+    def __init__(self):
+        self.encoding = 'pickle'
+        self.fields = None
+        self.scale = DEFAULT_SCALE
+        self._values = None
+        self._buf = bytearray()
+
+    def feed(self, data):
+        self._buf += data
+        messages = []
+        while self._buf:
+            if self.encoding == 'pickle':
+                msg = self._next_pickle()
+            else:
+                msg = self._next_frame()
+            if msg is None:
+                break
+            if msg is not _SKIP:
+                messages.append(msg)
+        return messages
+
+    def _accept(self, msg):
+        if isinstance(msg, dict) and msg.get('type') == 'HELLO':
+            self.encoding = msg.get('encoding', 'pickle')
+            self.fields = list(msg.get('fields', []))
+            self.scale = msg.get('scale', DEFAULT_SCALE)
+            self._values = None
+        return msg
+
+    def _next_pickle(self):
+        buf = io.BytesIO(self._buf)
+        try:
+            msg = pickle.load(buf)
+        except EOFError:
+            return None  # Truncated: wait for the rest
+        except pickle.UnpicklingError as e:
+            if 'truncated' in str(e):
+                return None
+            del self._buf[:]
+            raise
+        del self._buf[:buf.tell()]
+        return self._accept(msg)
+
+    def _next_frame(self):
+        length, pos = decode_varint(self._buf, 0)
+        if length is None or len(self._buf) < pos + length:
+            return None
+        body = bytes(self._buf[pos:pos + length])
+        del self._buf[:pos + length]
+
+        frame_type = body[0]
+        if frame_type == FRAME_PICKLE:
+            return self._accept(pickle.loads(body[1:]))
+
+        if frame_type == FRAME_KEYFRAME:
+            values, pos = [], 1
+            for _ in self.fields:
+                value, pos = decode_varint(body, pos)
+                values.append(unzigzag(value))
+        elif frame_type == FRAME_DELTA:
+            if self._values is None:
+                return _SKIP  # No keyframe yet; wait for the next one
+            values = list(self._values)
+            pos = 1 + (len(self.fields) + 7) // 8
+            for i in range(len(self.fields)):
+                if body[1 + i // 8] & (1 << (i % 8)):
+                    delta, pos = decode_varint(body, pos)
+                    values[i] += unzigzag(delta)
+        else:
+            raise ValueError(f"Unknown frame type {frame_type}")
+
+        self._values = values
+        return {name: value / self.scale for name, value in zip(self.fields, values)}
+
+
+_SKIP = object()
@@ -0,0 +1,359 @@
+# replay.py
+#
+# Replays recorded agent traffic into a local collector and measures how the
+# collector copes.
+#
+#   python master_server.py --capture caps/run1            # record real agents
+#   python replay.py import-logs logs/agent_*.log -o caps/logs   # or synthesize from agent logs
+#
+#   python master_server.py --port 13600 --slots 1024      # build under test
+#   python replay.py run caps/run1 --port 13600 --speed 10 --multiply 50 --report new.json
+#   python replay.py compare old.json new.json
+#
+# Every recorded TCP connection is replayed on its own connection with its
+# original timing divided by --speed (0 = as fast as possible); --multiply
+# starts that many copies of each, for many agents in parallel. UDP datagrams
+# are re-sent with the agent id suffixed per copy. Connections the collector
+# hangs up on (it refuses agents once its slot table is full) count as refused.
+#
+# While replaying, two probes measure latency:
+#   ingest    : a probe agent sends marked samples and times how long until the
+#               marker shows up in its shared-memory slot
+#   dashboard : time to fetch the dashboard page
+# The report (JSON) holds percentiles of both, for `compare` between builds.
+
+import json
+import os
+import pickle
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+
+from capture import CaptureWriter, read_capture, capture_files, remove_capture, OPEN, DATA, CLOSE, DATAGRAM
+from protocol import pack_datagram, unpack_datagram
+from slot_table import attach_table, snapshot_slots, SHARED_MEM_NAME
+
+PROBE_INTERVAL = 0.2    # Seconds between probe samples / dashboard fetches
+PROBE_TIMEOUT = 2.0     # Seconds before an ingest probe sample counts as missed
+LOG_SAMPLE_INTERVAL = 3.0  # Sample spacing of the default agent (1 s CPU read + 2 s sleep)
+
+
+# --- Loading captures ---
+
+class Session:
+    """One recorded TCP connection: when it opened and every chunk it sent."""
+
+    def __init__(self, peer, opened):
+        self.peer = peer
+        self.opened = opened
+        self.chunks = []  # (time, bytes)
+        self.closed = None
+
+
+def load(paths):
+    """Returns (sessions, datagrams, t0) from capture files, times relative to t0."""
+    sessions = {}
+    datagrams = []
+    for path in paths:
+        for t, conn_id, kind, payload in read_capture(path):
+            key = (path, conn_id)
+            if kind == OPEN:
+                sessions[key] = Session(payload.decode('utf-8'), t)
+            elif kind == DATA and key in sessions:
+                sessions[key].chunks.append((t, payload))
+            elif kind == CLOSE and key in sessions:
+                sessions[key].closed = t
+            elif kind == DATAGRAM:
+                datagrams.append((t, payload))
+    sessions = [s for s in sessions.values() if s.chunks]
+    datagrams.sort(key=lambda d: d[0])
+    starts = [s.opened for s in sessions] + [t for t, _ in datagrams[:1]]
+    t0 = min(starts) if starts else 0.0
+    return sessions, datagrams, t0
+
+
+def expand(paths):
+    """Accepts capture files or the PATH given to --capture."""
+    files = []
+    for path in paths:
+        files.extend([path] if os.path.isfile(path) else capture_files(path))
+    if not files:
+        sys.exit(f"No capture files found for {paths}")
+    return files
+
+
+# --- Replay ---
+
+class Counters:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.bytes = 0
+        self.chunks = 0
+        self.errors = 0
+        self.refused = 0  # Sessions the collector hung up on, e.g. with its slot table full
+
+    def add(self, nbytes):
+        with self.lock:
+            self.bytes += nbytes
+            self.chunks += 1
+
+
+def wait_until(start, offset, speed):
+    if speed > 0:
+        delay = start + offset / speed - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+
+def replay_session(session, t0, start, speed, host, port, counters):
+    wait_until(start, session.opened - t0, speed)
+    try:
+        with socket.create_connection((host, port)) as s:
+            s.setblocking(True)
+            for t, data in session.chunks:
+                wait_until(start, t - t0, speed)
+                s.sendall(data)
+                counters.add(len(data))
+                if not _discard_commands(s):
+                    raise ConnectionResetError
+            if session.closed is not None:
+                wait_until(start, session.closed - t0, speed)
+    except (ConnectionResetError, BrokenPipeError):
+        with counters.lock:
+            counters.refused += 1
+    except OSError:
+        with counters.lock:
+            counters.errors += 1
+
+
+def _discard_commands(s):
+    """Drops what the collector sent; False once it has closed the connection."""
+    # The collector may place tasks on replayed agents; nobody runs them
+    s.setblocking(False)
+    try:
+        while True:
+            if not s.recv(65536):
+                return False
+    except (BlockingIOError, InterruptedError):
+        return True
+    finally:
+        s.setblocking(True)
+
+
+def replay_datagrams(datagrams, copies, t0, start, speed, host, port, counters):
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+        for t, data in datagrams:
+            wait_until(start, t - t0, speed)
+            try:
+                agent_id, seq, stats = unpack_datagram(data)
+                variants = [pack_datagram(f"{agent_id}#{copy}" if copy else agent_id, seq, stats) for copy in range(copies)]
+            except ValueError:
+                variants = [data]
+            for payload in variants:
+                try:
+                    s.sendto(payload, (host, port))
+                    counters.add(len(payload))
+                except OSError:
+                    with counters.lock:
+                        counters.errors += 1
+
+
+# --- Probes ---
+
+def ingest_probe(host, port, shm_name, stop, latencies, missed):
+    """Sends samples with a marker CPU value and times their arrival in shared memory."""
+    shm = attach_table(shm_name)
+    try:
+        with socket.create_connection((host, port)) as s:
+            address = str(s.getsockname())
+            marker = 0
+            while not stop.is_set():
+                marker = marker % 999 + 1
+                value = marker / 10
+                sent = time.perf_counter()
+                s.sendall(pickle.dumps({"cpu": value, "ram": 0.0}))
+                while True:
+                    _, slots = snapshot_slots(shm)
+                    if any(slot.address == address and abs(slot.cpu - value) < 0.01 for slot in slots):
+                        latencies.append(time.perf_counter() - sent)
+                        break
+                    if time.perf_counter() - sent > PROBE_TIMEOUT:
+                        missed.append(marker)
+                        break
+                    time.sleep(0.0002)
+                _discard_commands(s)
+                stop.wait(PROBE_INTERVAL)
+    finally:
+        shm.close()
+
+
+def dashboard_probe(url, stop, latencies, missed):
+    while not stop.is_set():
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(url, timeout=PROBE_TIMEOUT) as response:
+                response.read()
+            latencies.append(time.perf_counter() - start)
+        except OSError:
+            missed.append(start)
+        stop.wait(PROBE_INTERVAL)
+
+
+def summarize(latencies, missed):
+    values = sorted(latencies)
+
+    def pct(q):
+        return values[min(len(values) - 1, int(q * len(values)))] * 1000 if values else None
+
+    return {"count": len(values), "missed": len(missed), "p50_ms": pct(0.50), "p90_ms": pct(0.90),
+            "p99_ms": pct(0.99), "max_ms": values[-1] * 1000 if values else None}
+
+
+def git_label():
+    try:
+        return subprocess.check_output(['git', 'describe', '--always', '--dirty'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def run(args):
+    sessions, datagrams, t0 = load(expand(args.captures))
+    print(f"Replaying {len(sessions)} connection(s) and {len(datagrams)} datagram(s) x{args.multiply} "
+          f"at {'max' if args.speed == 0 else f'{args.speed:g}x'} speed to {args.host}:{args.port}")
+
+    stop = threading.Event()
+    probes = {"ingest": ([], []), "dashboard": ([], [])}
+    probe_threads = [
+        threading.Thread(target=ingest_probe, args=(args.host, args.port, args.shm_name, stop) + probes["ingest"], daemon=True),
+        threading.Thread(target=dashboard_probe, args=(args.dashboard, stop) + probes["dashboard"], daemon=True),
+    ]
+    for thread in probe_threads:
+        thread.start()
+    time.sleep(args.warmup)  # Baseline probe samples before the load starts
+
+    counters = Counters()
+    start = time.monotonic()
+    workers = [threading.Thread(target=replay_session, args=(session, t0, start, args.speed, args.host, args.port, counters))
+               for session in sessions for _ in range(args.multiply)]
+    if datagrams:
+        workers.append(threading.Thread(target=replay_datagrams,
+                                        args=(datagrams, args.multiply, t0, start, args.speed, args.host, args.port, counters)))
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.monotonic() - start
+
+    stop.set()
+    for thread in probe_threads:
+        thread.join()
+
+    report = {
+        "label": args.label or git_label(),
+        "speed": args.speed,
+        "multiply": args.multiply,
+        "connections": len(sessions) * args.multiply,
+        "datagrams": len(datagrams) * args.multiply,
+        "bytes": counters.bytes,
+        "messages": counters.chunks,
+        "errors": counters.errors,
+        "refused": counters.refused,
+        "seconds": round(elapsed, 3),
+        "throughput_bytes_per_s": round(counters.bytes / elapsed, 1) if elapsed > 0 else None,
+        "ingest": summarize(*probes["ingest"]),
+        "dashboard": summarize(*probes["dashboard"]),
+    }
+    print(json.dumps(report, indent=2))
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.report}")
+
+
+# --- Report comparison ---
+
+def compare(args):
+    with open(args.old) as f:
+        old = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+    print(f"{'metric':24} {old.get('label', 'old'):>14} {new.get('label', 'new'):>14} {'change':>9}")
+    rows = [(key, old.get(key), new.get(key)) for key in ('throughput_bytes_per_s', 'refused')]
+    for probe in ('ingest', 'dashboard'):
+        for key in ('p50_ms', 'p90_ms', 'p99_ms', 'max_ms', 'missed'):
+            rows.append((f"{probe} {key}", old.get(probe, {}).get(key), new.get(probe, {}).get(key)))
+    for name, a, b in rows:
+        if a is None or b is None:
+            print(f"{name:24} {str(a):>14} {str(b):>14} {'':>9}")
+            continue
+        change = f"{(b - a) / a * 100:+.1f}%" if a else ''
+        print(f"{name:24} {a:14.3f} {b:14.3f} {change:>9}")
+
+
+# --- Captures from agent logs ---
+
+def import_logs(args):
+    """
+    Builds a capture from agent logs (one connection per log, one pickled sample
+    per 'Sent data:' line, LOG_SAMPLE_INTERVAL apart): the logs have no timestamps.
+    """
+    import ast
+
+    remove_capture(args.output)
+    writer = CaptureWriter(f"{args.output}.0")
+    base = time.time()
+    for path in args.logs:
+        samples = []
+        with open(path, errors='replace') as f:
+            for line in f:
+                if line.startswith('Sent data:'):
+                    try:
+                        samples.append(ast.literal_eval(line.split(':', 1)[1].strip()))
+                    except (ValueError, SyntaxError):
+                        continue
+        if not samples:
+            continue
+        conn_id = writer.new_conn(os.path.basename(path), at=base)
+        for i, stats in enumerate(samples):
+            writer.write(conn_id, DATA, pickle.dumps(stats), at=base + i * LOG_SAMPLE_INTERVAL)
+        writer.write(conn_id, CLOSE, at=base + len(samples) * LOG_SAMPLE_INTERVAL)
+        print(f"{path}: {len(samples)} samples")
+    writer.close()
+    print(f"Capture written to {writer.path}")
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Replay captured agent traffic into a collector")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    p = commands.add_parser('run', help="Replay captures and report latencies")
+    p.add_argument('captures', nargs='+', help="Capture files, or the PATH given to --capture")
+    p.add_argument('--host', default='127.0.0.1')
+    p.add_argument('--port', type=int, default=13579)
+    p.add_argument('--speed', type=float, default=1.0, help="Time compression: 1, 10, ... or 0 for max speed (default: 1)")
+    p.add_argument('--multiply', type=int, default=1, help="Parallel copies of each recorded agent (default: 1)")
+    p.add_argument('--dashboard', default='http://127.0.0.1:8080/', help="Dashboard URL to probe")
+    p.add_argument('--shm-name', default=SHARED_MEM_NAME, help="Collector's shared memory segment")
+    p.add_argument('--warmup', type=float, default=1.0, help="Seconds of probing before the replay starts (default: 1)")
+    p.add_argument('--label', default=None, help="Build label in the report (default: git describe)")
+    p.add_argument('--report', default=None, help="Write the JSON report here")
+    p.set_defaults(func=run)
+
+    p = commands.add_parser('compare', help="Compare two reports")
+    p.add_argument('old')
+    p.add_argument('new')
+    p.set_defaults(func=compare)
+
+    p = commands.add_parser('import-logs', help="Make a capture from agent_*.log files")
+    p.add_argument('logs', nargs='+')
+    p.add_argument('-o', '--output', required=True, help="Capture PATH (writes PATH.0)")
+    p.set_defaults(func=import_logs)
+
+    args = parser.parse_args()
+    args.func(args)
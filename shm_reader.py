@@ -0,0 +1,153 @@
+# shm_reader.py
+#
+# Read-only access to the collector's slot table for local tools (schedulers,
+# exporters, notebooks), as a NumPy structured array.
+#
+#   from shm_reader import ClusterReader
+#
+#   with ClusterReader() as reader:
+#       snap = reader.snapshot()             # consistent copy, no lock taken
+#       busy = reader.where(snap.table, cpu_above=80)
+#       print(snap.version, busy['address'])
+#       version = reader.wait_for_change(snap.version, timeout=10)
+#       print(reader.summary().cpu.mean)     # cluster aggregates in O(1)
+#
+# The dtype is derived from slot_table.SHARED_MEM_FORMAT, so tools never
+# re-implement the layout. Snapshots use the table's seqlock (see slot_table.py):
+# readers never block the collector, and the version tells when anything changed.
+# Requires NumPy; the master itself does not.
+
+import struct
+import time
+from collections import namedtuple
+
+import numpy as np
+
+from slot_table import (SHARED_MEM_NAME, SHARED_MEM_FORMAT, PACKED_DATA_SIZE, slot_capacity,
+                        HEADER_SIZE, FLAG_STALE, Slot, attach_table, read_version, snapshot_table, snapshot_summary,
+                        snapshot_latencies)
+
+# struct code -> NumPy type (native byte order, like the struct format)
+_NUMPY_CODES = {'i': 'i4', 'I': 'u4', 'q': 'i8', 'Q': 'u8', 'f': 'f4', 'd': 'f8', 'B': 'u1', 'b': 'i1', 'h': 'i2', 'H': 'u2'}
+
+
+def _slot_dtype():
+    """Structured dtype matching SHARED_MEM_FORMAT field by field, at the same offsets."""
+    fmt = SHARED_MEM_FORMAT
+    formats, offsets = [], []
+    i = 0
+    while i < len(fmt):
+        start = i
+        while fmt[i].isdigit():
+            i += 1
+        count, code = fmt[start:i] or '1', fmt[i]
+        i += 1
+        formats.append('S' + count if code == 's' else _NUMPY_CODES[code])
+        # End of this field (after any alignment padding before it) minus its size
+        offsets.append(struct.calcsize(fmt[:i]) - struct.calcsize(fmt[start:i]))
+    names = Slot._fields[1:]  # Everything but the index
+    return np.dtype({'names': list(names), 'formats': formats, 'offsets': offsets, 'itemsize': PACKED_DATA_SIZE})
+
+
+SLOT_DTYPE = _slot_dtype()
+
+Snapshot = namedtuple('Snapshot', ['version', 'table'])
+
+
+class ClusterReader:
+    """Maps the slot table of a running master read-only. Never takes the collector's lock."""
+
+    def __init__(self, name=SHARED_MEM_NAME):
+        self._shm = attach_table(name)
+        # Zero-copy view of the live table. Rows may change (or tear) while you
+        # read them; use snapshot() for anything that must be consistent.
+        self.live = np.ndarray((slot_capacity(self._shm),), dtype=SLOT_DTYPE, buffer=self._shm.buf, offset=HEADER_SIZE)
+
+    @property
+    def version(self):
+        """Changes whenever the collector writes the table (even = no write in progress)."""
+        return read_version(self._shm)
+
+    def snapshot(self):
+        """A consistent copy of the whole table with the version it was taken at."""
+        version, data = snapshot_table(self._shm)
+        return Snapshot(version, np.frombuffer(data, dtype=SLOT_DTYPE).copy())
+
+    def summary(self):
+        """
+        Cluster aggregates (aggregates.Summary) maintained by the collector:
+        counts, and per metric mean, std, min, max and a histogram. O(1).
+        """
+        return snapshot_summary(self._shm)
+
+    def latencies(self):
+        """{stage: tracing.StageSummary} of the samples agents traced, from sample to dashboard render."""
+        return snapshot_latencies(self._shm)
+
+    def active(self, table=None):
+        """Rows of connected agents (from a fresh snapshot if no table is given)."""
+        if table is None:
+            table = self.snapshot().table
+        return table[table['slot_id'] != 0]
+
+    @staticmethod
+    def where(table, cpu_above=None, cpu_below=None, ram_above=None, ram_below=None, worker=None, stale=None):
+        """Active rows matching every given condition, as one vectorized mask."""
+        mask = table['slot_id'] != 0
+        if cpu_above is not None:
+            mask &= table['cpu'] > cpu_above
+        if cpu_below is not None:
+            mask &= table['cpu'] < cpu_below
+        if ram_above is not None:
+            mask &= table['ram'] > ram_above
+        if ram_below is not None:
+            mask &= table['ram'] < ram_below
+        if worker is not None:
+            mask &= table['worker'] == worker
+        if stale is not None:
+            mask &= ((table['flags'] & FLAG_STALE) != 0) == stale
+        return table[mask]
+
+    @staticmethod
+    def addresses(table):
+        return [addr.decode('utf-8').strip('\x00') for addr in table['address']]
+
+    def wait_for_change(self, version, timeout=None, poll=0.05):
+        """
+        Blocks until the table version differs from `version`. Returns the new
+        version, or None on timeout. Polling a counter costs one 8-byte read.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            current = self.version
+            if current != version and not current & 1:
+                return current
+            if deadline is not None and time.monotonic() >= deadline:
+                return None
+            time.sleep(poll)
+
+    def close(self):
+        # The view must go before the buffer it points into can be released
+        self.live = None
+        self._shm.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+if __name__ == '__main__':
+    # Prints the table whenever it changes (a quick check that the master is writing)
+    with ClusterReader() as reader:
+        while True:
+            snap = reader.snapshot()
+            rows = reader.active(snap.table)
+            summary = reader.summary()
+            print(f"version {snap.version}: {len(rows)} agent(s), {summary.stale} stale, "
+                  f"cpu mean {summary.cpu.mean:.1f}% max {summary.cpu.max:.1f}%, "
+                  f"ram mean {summary.ram.mean:.1f}% max {summary.ram.max:.1f}%")
+            for row, address in zip(rows, reader.addresses(rows)):
+                print(f"  slot {row['slot_id']:3d} {address:40} cpu={row['cpu']:5.1f}% ram={row['ram']:5.1f}% worker={row['worker']}")
+            reader.wait_for_change(snap.version)
@@ -0,0 +1,430 @@
+# slot_table.py
+#
+# Layout of the shared-memory slot table written by the collector and read by
+# the dashboard and the placement service. One fixed-size slot per agent.
+#
+# The segment starts with a header holding a sequence counter, followed by the
+# slots. Writers hold the multiprocessing lock (to exclude each other) and make
+# the counter odd while they write a slot, even again when done (a seqlock).
+# Readers take no lock: they copy the table and retry if the counter was odd
+# or changed meanwhile (snapshot_table). The counter also works as a version
+# number: it changes exactly when the table does. shm_reader.py builds a NumPy
+# view on the same layout.
+#
+# The header also holds cluster-wide aggregates, updated with every slot write
+# under the same seqlock (snapshot_summary reads them in O(1)). Their
+# bookkeeping (see aggregates.py) follows the table.
+#
+#   | counter, identity, capacity | aggregates | slots ... | aggregate index | latency histograms |
+#
+# The identity (magic, layout version, layout checksum) lets a restarted
+# master tell whether a segment left behind was written with the same layout
+# and can be re-adopted as is (`master_server.py --warm-restart`).
+#
+# The number of slots is chosen by the master (`--slots`) and kept in the
+# header; everything after the slots is placed according to it (layout()),
+# so processes and tools attaching to the segment read it from there.
+
+import os
+import struct
+import time
+import zlib
+from collections import namedtuple
+from contextlib import contextmanager
+from functools import lru_cache
+from multiprocessing import shared_memory, resource_tracker
+
+import aggregates
+import tracing
+
+SHARED_MEM_NAME = 'cluster_sentinel_shm'
+DEFAULT_CAPACITY = 10  # Slots, unless the master is given --slots
+# slot_id (int), address (string 64 bytes), cpu (float), ram (float),
+# worker (int, index of the collector process holding the agent's connection),
+# flags (int, FLAG_* bits), agent_id (string 64 bytes, name the agent reported),
+# received, committed (double, time.monotonic() when the sample arrived / was written)
+SHARED_MEM_FORMAT = 'i64sffii64sdd'
+PACKED_DATA_SIZE = struct.calcsize(SHARED_MEM_FORMAT)
+HEADER_FORMAT = 'Q'  # Sequence counter
+IDENTITY = struct.Struct('8sII')  # Magic, layout version, layout checksum (after the counter)
+MAGIC = b'CSSLOTS\x00'
+LAYOUT_VERSION = 3  # Bump when the meaning of the layout changes without its shape changing
+CAPACITY = struct.Struct('I')  # Number of slots (after the identity)
+CAPACITY_OFFSET = struct.calcsize(HEADER_FORMAT) + IDENTITY.size
+AGGREGATE_OFFSET = 64
+HEADER_SIZE = -(-(AGGREGATE_OFFSET + aggregates.BLOCK_SIZE) // 64) * 64  # Padded to whole cache lines
+
+# Shape of everything in the segment but the slot count; any change forces a cold reset
+LAYOUT_CHECKSUM = zlib.crc32(repr((SHARED_MEM_FORMAT, HEADER_FORMAT, AGGREGATE_OFFSET, HEADER_SIZE,
+                                   aggregates.METRICS, aggregates.AGGREGATE_FIELDS, aggregates.FIXED_POINT,
+                                   aggregates.HISTOGRAM_BUCKETS, aggregates.index_size(1), tracing.STAGES,
+                                   tracing.BUCKETS)).encode('ascii'))
+
+Layout = namedtuple('Layout', ['capacity', 'table_size', 'index_offset', 'index_size', 'trace_offset', 'size'])
+
+
+@lru_cache(maxsize=None)
+def layout(capacity=DEFAULT_CAPACITY):
+    """Where everything after the header lives in a segment of `capacity` slots."""
+    table_size = PACKED_DATA_SIZE * capacity
+    index_offset = -(-(HEADER_SIZE + table_size) // 8) * 8
+    index_size = aggregates.index_size(capacity)
+    trace_offset = index_offset + index_size
+    return Layout(capacity, table_size, index_offset, index_size, trace_offset, trace_offset + tracing.TRACE_SIZE)
+
+
+def slot_capacity(shm):
+    """Number of slots of a segment (0 while the master is still creating it)."""
+    return CAPACITY.unpack_from(shm.buf, CAPACITY_OFFSET)[0]
+
+
+def _layout(shm):
+    return layout(slot_capacity(shm))
+
+SNAPSHOT_TIMEOUT = 1.0  # Seconds a reader retries before giving up on a stuck writer
+
+# Worker value of slots fed by the UDP collector: no connection to send commands on
+UDP_WORKER = -1
+
+# Slot flags
+FLAG_STALE = 1   # Agent missed its deadline; the slot is reaped unless it reports again
+FLAG_ORPHAN = 2  # Adopted from the previous master; waits for its agent to reconnect (always also stale)
+
+# Liveness (enforced by the collectors with a timing wheel)
+AGENT_TIMEOUT = 5.0  # Seconds without any message (sample or heartbeat) before a slot goes stale
+STALE_GRACE = 10.0   # Seconds a stale slot is kept before the agent is dropped
+
+EMPTY_SLOT = struct.pack(SHARED_MEM_FORMAT, 0, b'', 0.0, 0.0, 0, 0, b'', 0.0, 0.0)
+
+Slot = namedtuple('Slot', ['index', 'slot_id', 'address', 'cpu', 'ram', 'worker', 'flags', 'agent_id', 'received', 'committed'])
+
+
+@contextmanager
+def _tracker_lock(name):
+    """
+    Keeps one process's register/unregister pair for `name` together. The
+    master's children share one resource tracker, which keeps a set rather
+    than a count: two interleaved pairs would make the second unregister fail.
+    """
+    if os.name != 'posix':
+        yield  # No resource tracker
+        return
+    import fcntl
+    import tempfile
+    with open(os.path.join(tempfile.gettempdir(), f"{name.lstrip('/')}.attach.lock"), 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        yield
+
+
+def _untracked(name, **kwargs):
+    try:
+        return shared_memory.SharedMemory(name, track=False, **kwargs)  # Python 3.13+
+    except TypeError:
+        pass
+    # Older versions register every handle: take it back right away
+    with _tracker_lock(name):
+        shm = shared_memory.SharedMemory(name, **kwargs)
+        if os.name == 'posix':
+            resource_tracker.unregister(shm._name, 'shared_memory')
+    return shm
+
+
+def attach_table(name=SHARED_MEM_NAME):
+    """
+    Attaches to the master's segment without handing it to the resource
+    tracker, which would unlink the segment when this process (a tool, or one
+    of the master's children) exits.
+    """
+    return _untracked(name=name)
+
+
+def create_table(name=SHARED_MEM_NAME, slots=DEFAULT_CAPACITY):
+    """
+    Creates a segment for `slots` agents (init_table then sets it up),
+    untracked like attach_table: the resource tracker would unlink it when the
+    master exits, even with --warm-restart. The master unlinks it itself
+    (unlink_table), and a segment left by a crash is adopted or removed on
+    the next start.
+    """
+    return _untracked(name=name, create=True, size=layout(slots).size)
+
+
+def unlink_table(name=SHARED_MEM_NAME):
+    """Removes a segment left behind, through a tracked handle so the tracker's bookkeeping stays balanced."""
+    with _tracker_lock(name):
+        shm = shared_memory.SharedMemory(name=name)
+        shm.close()
+        shm.unlink()
+
+
+def slot_offset(slot_index):
+    return HEADER_SIZE + slot_index * PACKED_DATA_SIZE
+
+
+def _counter(shm):
+    # A typed view stores the counter with one 8-byte write. struct.pack_into
+    # zero-fills its target before packing, so a reader could see 0 mid-write.
+    return shm.buf[:struct.calcsize(HEADER_FORMAT)].cast(HEADER_FORMAT)
+
+
+def read_version(shm):
+    """Current sequence counter; odd while a write is in progress."""
+    return _counter(shm)[0]
+
+
+def _bump_version(shm):
+    counter = _counter(shm)
+    counter[0] += 1
+
+
+def _aggregates(shm):
+    lay = _layout(shm)
+    block = shm.buf[AGGREGATE_OFFSET:AGGREGATE_OFFSET + aggregates.BLOCK_SIZE].cast('q')
+    index = shm.buf[lay.index_offset:lay.index_offset + lay.index_size].cast('q')
+    return aggregates.Aggregates(block, index, lay.capacity)
+
+
+def _rebuild_aggregates(shm):
+    """Recomputes the aggregates from the table. Caller holds the lock and has the counter odd."""
+    aggs = _aggregates(shm)
+    aggs.reset()
+    for i in range(slot_capacity(shm)):
+        slot_id, _, cpu, ram, _, flags, _, _, committed = read_slot(shm, i)
+        if slot_id != 0 and committed:
+            aggs.update(i, (cpu, ram), flags & FLAG_STALE)
+
+
+def _trace(shm):
+    offset = _layout(shm).trace_offset
+    return shm.buf[offset:offset + tracing.TRACE_SIZE].cast('q')
+
+
+def record_latency(shm, stage, seconds):
+    """Adds a latency to a stage's histogram (see tracing.py). Collectors hold the lock; the dashboard is the only writer of 'render'."""
+    tracing.record(_trace(shm), stage, seconds)
+
+
+def snapshot_latencies(shm):
+    """{stage: tracing.StageSummary} of everything traced so far. Lock-free."""
+    offset = _layout(shm).trace_offset
+    data = bytes(shm.buf[offset:offset + tracing.TRACE_SIZE])
+    return tracing.decode(struct.unpack(f'{tracing.TRACE_SIZE // 8}q', data))
+
+
+def _consistent_copy(shm, start, end):
+    deadline = time.monotonic() + SNAPSHOT_TIMEOUT
+    while True:
+        before = read_version(shm)
+        if not before & 1:
+            data = bytes(shm.buf[start:end])
+            if read_version(shm) == before:
+                return before, data
+        if time.monotonic() > deadline:
+            raise TimeoutError("Slot table is stuck in the middle of a write")
+        time.sleep(0)
+
+
+def snapshot_table(shm):
+    """
+    Lock-free consistent copy of the slot table. Returns (version, bytes).
+    Raises TimeoutError if a writer stays in the middle of a write (one that
+    died holding the lock; see clear_worker_slots).
+    """
+    return _consistent_copy(shm, HEADER_SIZE, HEADER_SIZE + _layout(shm).table_size)
+
+
+def snapshot_summary(shm):
+    """
+    Lock-free cluster summary (aggregates.Summary): agent and stale counts and,
+    per metric, mean, standard deviation, min, max and histogram. O(1): copies
+    only the aggregates, however many slots there are.
+    """
+    version, data = _consistent_copy(shm, AGGREGATE_OFFSET, AGGREGATE_OFFSET + aggregates.BLOCK_SIZE)
+    return aggregates.decode(version, struct.unpack(f'{aggregates.AGGREGATE_FIELDS}q', data))
+
+
+def read_slot(shm, slot_index):
+    """Returns (slot_id, addr_bytes, cpu, ram, worker, flags, agent_id, received, committed). Caller holds the lock."""
+    offset = slot_offset(slot_index)
+    return struct.unpack(SHARED_MEM_FORMAT, shm.buf[offset:offset + PACKED_DATA_SIZE])
+
+
+def write_slot(shm, slot_index, addr_bytes, cpu, ram, worker=0, flags=0, agent_id=b'', received=0.0, committed=None):
+    """
+    Marks the slot active (id = index + 1, to avoid 0) with the latest stats,
+    received at `received` (time.monotonic()). A new sample is stamped with
+    the commit time; writes that keep the stats pass the sample's `committed`
+    along, so the dashboard does not take them for new samples. A slot with
+    no sample yet (committed 0.0, see claim_slot) stays out of the aggregates.
+    Returns the commit time.
+    """
+    offset = slot_offset(slot_index)
+    _bump_version(shm)
+    if committed is None:
+        committed = time.monotonic()
+    shm.buf[offset:offset + PACKED_DATA_SIZE] = struct.pack(SHARED_MEM_FORMAT, slot_index + 1, addr_bytes, cpu, ram, worker, flags,
+                                                            agent_id, received, committed)
+    _aggregates(shm).update(slot_index, (cpu, ram) if committed else None, flags & FLAG_STALE)
+    _bump_version(shm)
+    return committed
+
+
+def set_slot_flags(shm, slot_index, flags):
+    """Replaces the flags of an active slot, keeping its stats. Caller holds the lock."""
+    slot_id, addr_bytes, cpu, ram, worker, _, agent_id, received, committed = read_slot(shm, slot_index)
+    if slot_id != 0:
+        write_slot(shm, slot_index, addr_bytes, cpu, ram, worker, flags, agent_id, received, committed)
+
+
+def set_slot_agent(shm, slot_index, agent_id):
+    """Records the name an agent reported, keeping its stats. Caller holds the lock."""
+    slot_id, addr_bytes, cpu, ram, worker, flags, _, received, committed = read_slot(shm, slot_index)
+    if slot_id != 0:
+        write_slot(shm, slot_index, addr_bytes, cpu, ram, worker, flags, agent_id, received, committed)
+
+
+def clear_slot(shm, slot_index):
+    offset = slot_offset(slot_index)
+    # 0 = Inactive
+    _bump_version(shm)
+    shm.buf[offset:offset + PACKED_DATA_SIZE] = EMPTY_SLOT
+    _aggregates(shm).update(slot_index)
+    _bump_version(shm)
+
+
+def clear_table(shm):
+    _bump_version(shm)
+    _aggregates(shm).reset()
+    _bump_version(shm)
+    for i in range(slot_capacity(shm)):
+        clear_slot(shm, i)
+
+
+def init_table(shm, slots=DEFAULT_CAPACITY):
+    """Cold start: sizes and empties the table, then stamps the segment with this layout's identity."""
+    CAPACITY.pack_into(shm.buf, CAPACITY_OFFSET, slots)
+    clear_table(shm)
+    IDENTITY.pack_into(shm.buf, struct.calcsize(HEADER_FORMAT), MAGIC, LAYOUT_VERSION, LAYOUT_CHECKSUM)
+
+
+def layout_mismatch(shm, slots=DEFAULT_CAPACITY):
+    """Why a segment left by a previous master cannot be adopted by one with `slots` slots, or None if it can."""
+    if shm.size < HEADER_SIZE:
+        return f"segment is {shm.size} bytes, smaller than the header"
+    magic, version, checksum = IDENTITY.unpack_from(shm.buf, struct.calcsize(HEADER_FORMAT))
+    if magic != MAGIC:
+        return "no slot table header (written before warm restarts, or not ours)"
+    if version != LAYOUT_VERSION:
+        return f"layout version {version}, this master uses {LAYOUT_VERSION}"
+    if checksum != LAYOUT_CHECKSUM:
+        return f"layout checksum {checksum:08x}, this master uses {LAYOUT_CHECKSUM:08x}"
+    if slot_capacity(shm) != slots:
+        return f"{slot_capacity(shm)} slots, this master uses {slots}"
+    if shm.size < layout(slots).size:
+        return f"segment is {shm.size} bytes, layout needs {layout(slots).size}"
+    return None
+
+
+def adopt_table(shm):
+    """
+    Warm restart: takes over the slots of a previous master (layout already
+    checked). Their connections are gone, so each slot is marked stale and
+    orphaned until its agent reconnects (adopt_orphan) or it is given up
+    (clear_orphans). Caller holds the lock. Returns the adopted slot indices.
+    """
+    if read_version(shm) & 1:
+        # The previous master died in the middle of a write
+        _rebuild_aggregates(shm)
+        _bump_version(shm)
+    adopted = []
+    for i in range(slot_capacity(shm)):
+        slot_id, _, _, _, _, flags, _, _, _ = read_slot(shm, i)
+        if slot_id != 0:
+            set_slot_flags(shm, i, flags | FLAG_STALE | FLAG_ORPHAN)
+            adopted.append(i)
+    return adopted
+
+
+def adopt_orphan(shm, agent_id, addr_bytes, worker):
+    """
+    Gives an agent back the slot it held before a warm restart, with its
+    stats, if it reported an id and such a slot is still orphaned. Caller
+    holds the lock. Returns the slot index or None.
+    """
+    if not agent_id:
+        return None
+    for i in range(slot_capacity(shm)):
+        slot_id, _, cpu, ram, _, flags, slot_agent, received, committed = read_slot(shm, i)
+        if slot_id != 0 and flags & FLAG_ORPHAN and slot_agent.rstrip(b'\x00') == agent_id:
+            write_slot(shm, i, addr_bytes, cpu, ram, worker, 0, agent_id, received, committed)
+            return i
+    return None
+
+
+def clear_orphans(shm):
+    """Frees the adopted slots whose agents never came back. Caller holds the lock."""
+    cleared = []
+    for i in range(slot_capacity(shm)):
+        slot_id, _, _, _, _, flags, _, _, _ = read_slot(shm, i)
+        if slot_id != 0 and flags & FLAG_ORPHAN:
+            clear_slot(shm, i)
+            cleared.append(i)
+    return cleared
+
+
+def find_slot(shm):
+    """Finds an empty slot in shared memory."""
+    for i in range(slot_capacity(shm)):
+        slot_id = read_slot(shm, i)[0]
+        if slot_id == 0:
+            return i
+    return None
+
+
+def claim_slot(shm, addr_bytes, worker=0, agent_id=b''):
+    """
+    Finds an empty slot and marks it taken in one step. Caller holds the lock,
+    which makes this safe across collector processes. Returns None if full.
+    """
+    slot_index = find_slot(shm)
+    if slot_index is not None:
+        write_slot(shm, slot_index, addr_bytes, 0.0, 0.0, worker, 0, agent_id, committed=0.0)  # No sample yet
+    return slot_index
+
+
+def clear_worker_slots(shm, worker):
+    """Frees every slot owned by a collector process that died. Caller holds the lock."""
+    if read_version(shm) & 1:
+        # The worker died in the middle of a write, possibly halfway through
+        # the aggregates; rebuild them, then let readers through again
+        _rebuild_aggregates(shm)
+        _bump_version(shm)
+    cleared = []
+    for i in range(slot_capacity(shm)):
+        slot_id, _, _, _, owner, flags, _, _, _ = read_slot(shm, i)
+        if slot_id != 0 and owner == worker and not flags & FLAG_ORPHAN:
+            clear_slot(shm, i)
+            cleared.append(i)
+    return cleared
+
+
+def active_slots(shm):
+    """Yields a Slot for every active slot. Caller holds the lock."""
+    for i in range(slot_capacity(shm)):
+        slot_id, addr_bytes, cpu, ram, worker, flags, agent_id, received, committed = read_slot(shm, i)
+        if slot_id != 0:
+            # Decode bytes to string and strip null padding
+            yield Slot(i, slot_id, addr_bytes.decode('utf-8').strip('\x00'), cpu, ram, worker, flags,
+                       agent_id.decode('utf-8', 'replace').strip('\x00'), received, committed)
+
+
+def snapshot_slots(shm):
+    """Lock-free: returns (version, [Slot]) for the active slots of one consistent snapshot."""
+    version, data = snapshot_table(shm)
+    slots = []
+    for i, (slot_id, addr_bytes, cpu, ram, worker, flags, agent_id, received, committed) in enumerate(
+            struct.iter_unpack(SHARED_MEM_FORMAT, data)):
+        if slot_id != 0:
+            slots.append(Slot(i, slot_id, addr_bytes.decode('utf-8').strip('\x00'), cpu, ram, worker, flags,
+                              agent_id.decode('utf-8', 'replace').strip('\x00'), received, committed))
+    return version, slots
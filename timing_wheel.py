@@ -0,0 +1,69 @@
+# timing_wheel.py
+#
+# Hashed timing wheel for per-agent deadlines.
+#
+# Every sample from an agent pushes its deadline back. With thousands of agents
+# that is thousands of re-arms per second, so arming and cancelling must be
+# O(1): a deadline goes into the bucket of its tick (tick % size), and
+# advancing the clock only looks at the buckets of the ticks that passed.
+# Deadlines further out than one turn of the wheel stay in their bucket until
+# the turn in which they are due.
+#
+# Not thread-safe: callers serialize access (the collector holds a lock).
+
+import math
+import time
+
+DEFAULT_TICK = 0.1   # Seconds per bucket: the resolution of deadlines
+DEFAULT_SIZE = 512   # Buckets; one turn covers size * tick seconds
+
+
+class TimingWheel:
+    def __init__(self, tick=DEFAULT_TICK, size=DEFAULT_SIZE, now=None):
+        self.tick = tick
+        self.size = size
+        self._buckets = [{} for _ in range(size)]  # key -> deadline tick
+        self._bucket_of = {}                       # key -> bucket index
+        self._current = self._tick_of(time.monotonic() if now is None else now)
+
+    def _tick_of(self, t):
+        return math.floor(t / self.tick)
+
+    def arm(self, key, delay, now=None):
+        """(Re)schedules `key` to expire `delay` seconds from now."""
+        if now is None:
+            now = time.monotonic()
+        deadline = max(math.ceil((now + delay) / self.tick), self._current + 1)
+        self.cancel(key)
+        index = deadline % self.size
+        self._buckets[index][key] = deadline
+        self._bucket_of[key] = index
+
+    def cancel(self, key):
+        index = self._bucket_of.pop(key, None)
+        if index is not None:
+            del self._buckets[index][key]
+
+    def advance(self, now=None):
+        """Moves the clock to `now`. Returns the keys whose deadline has passed."""
+        target = self._tick_of(time.monotonic() if now is None else now)
+        if target <= self._current:
+            return []
+        # After a long pause every bucket is due once; no need to walk them twice
+        ticks = range(self._current + 1, target + 1) if target - self._current < self.size else range(self.size)
+        expired = []
+        for t in ticks:
+            bucket = self._buckets[t % self.size]
+            due = [key for key, deadline in bucket.items() if deadline <= target]
+            for key in due:
+                del bucket[key]
+                del self._bucket_of[key]
+            expired.extend(due)
+        self._current = target
+        return expired
+
+    def __len__(self):
+        return len(self._bucket_of)
+
+    def __contains__(self, key):
+        return key in self._bucket_of
@@ -0,0 +1,111 @@
+# tracing.py
+#
+# End-to-end latency of a sample, from the agent's measurement to the
+# dashboard page that shows it, split into stages:
+#
+#   sample   agent: sample taken -> sent                    (agent clock)
+#   network  agent send -> collector recv (bridge, tunnel)  (both clocks, offset-corrected)
+#   decode   collector: recv -> message decoded
+#   lock     collector: decoded -> collectors' lock acquired
+#   commit   collector: lock acquired -> slot written
+#   render   slot written -> first dashboard page showing it
+#
+# Agents trace one sample in every --trace-every (default 20). A traced sample
+# is followed by a TRACE message with its sequence number on the connection
+# and its agent-side timestamps. Agents and collector use time.monotonic(),
+# which is comparable between processes on one host but not between hosts,
+# so the collector estimates each agent's clock offset NTP-style over the
+# command channel (ClockEstimator).
+#
+# Each stage is a histogram with power-of-two microsecond buckets, kept in
+# the shared-memory segment (see slot_table.py) so the dashboard and tools
+# can read what the collector processes recorded. The counters only grow and
+# are read without the seqlock: a reader may see one sample in the count but
+# not yet in its bucket, which does not matter for a histogram.
+
+import math
+from collections import deque, namedtuple
+
+STAGES = ('sample', 'network', 'decode', 'lock', 'commit', 'render')
+BUCKETS = 24            # Bucket k: below 2**k microseconds (the last one catches everything above ~8 s)
+STAGE_FIELDS = 2 + BUCKETS  # count, total microseconds, buckets
+TRACE_SIZE = len(STAGES) * STAGE_FIELDS * 8
+
+TRACE_EVERY = 20            # Agents trace one sample in this many (0 = off)
+CLOCK_SYNC_INTERVAL = 30.0  # Seconds between clock offset measurements per traced agent
+CLOCK_SAMPLES = 8           # Offset measurements kept; the one with the shortest round trip wins
+
+
+def _bucket(us):
+    return min(int(us).bit_length(), BUCKETS - 1)
+
+
+def record(view, stage, seconds):
+    """Adds one latency to a stage's histogram. `view` is an int64 view of the trace region."""
+    base = STAGES.index(stage) * STAGE_FIELDS
+    us = max(seconds, 0.0) * 1e6
+    view[base] += 1
+    view[base + 1] += int(us)
+    view[base + 2 + _bucket(us)] += 1
+
+
+def message_times(message, *keys):
+    """The named timestamps of an agent message, or None if any is missing or not a finite number."""
+    times = tuple(message.get(key) for key in keys)
+    if all(isinstance(t, (int, float)) and not isinstance(t, bool) and math.isfinite(t) for t in times):
+        return times
+    return None
+
+
+class ClockEstimator:
+    """
+    Offset of an agent's monotonic clock from ours. Each exchange: we send at
+    t0, the agent receives at t1 and answers at t2 (its clock), we receive at
+    t3. The offset is exact if the way there and back took equally long, so
+    the exchange with the shortest round trip is the most trustworthy.
+    """
+
+    def __init__(self):
+        self._samples = deque(maxlen=CLOCK_SAMPLES)  # (round trip, offset)
+        self.last_sync = None
+
+    def update(self, t0, t1, t2, t3):
+        round_trip = (t3 - t0) - (t2 - t1)
+        self._samples.append((round_trip, ((t1 - t0) + (t2 - t3)) / 2))
+
+    @property
+    def offset(self):
+        """Agent clock minus ours, or None before the first exchange."""
+        return min(self._samples)[1] if self._samples else None
+
+    def to_local(self, agent_time):
+        return agent_time - self.offset
+
+
+StageSummary = namedtuple('StageSummary', ['count', 'mean', 'p50', 'p90', 'p99', 'histogram'])
+
+
+def _percentile(histogram, count, q):
+    """Upper bound (seconds) of the bucket holding the q-quantile."""
+    target = q * count
+    seen = 0
+    for k, n in enumerate(histogram):
+        seen += n
+        if seen >= target:
+            return (1 << k) / 1e6
+    return (1 << (BUCKETS - 1)) / 1e6
+
+
+def decode(fields):
+    """Turns a copied trace region (a sequence of ints) into {stage: StageSummary}, times in seconds."""
+    stages = {}
+    for i, stage in enumerate(STAGES):
+        base = i * STAGE_FIELDS
+        count, total = fields[base], fields[base + 1]
+        histogram = tuple(fields[base + 2:base + STAGE_FIELDS])
+        if count:
+            stages[stage] = StageSummary(count, total / count / 1e6, _percentile(histogram, count, 0.5),
+                                         _percentile(histogram, count, 0.9), _percentile(histogram, count, 0.99), histogram)
+        else:
+            stages[stage] = StageSummary(0, 0.0, 0.0, 0.0, 0.0, histogram)
+    return stages
@@ -0,0 +1,251 @@
+# udp_ingest.py
+#
+# Connectionless ingest for best-effort, high-frequency metrics.
+#
+# An agent started with --transport udp sends each sample as one datagram
+# (protocol.pack_datagram) carrying its agent id and a sequence number. One
+# collector process drains a single UDP socket: no connection, thread or
+# socket per agent. Agents get a slot on their first datagram. After
+# AGENT_TIMEOUT seconds of silence the slot is marked stale, after STALE_GRACE
+# more it is freed (deadlines live in one timing wheel). A datagram without
+# values is a heartbeat. Gaps, late (reordered) datagrams and duplicates are
+# counted per agent from the sequence numbers. Agents that find the table full
+# are logged once and their dropped samples counted until a slot frees up.
+#
+# UDP agents have no command channel, so their slots are marked with
+# slot_table.UDP_WORKER and the placement service does not give them tasks.
+
+import select
+import socket
+import sys
+import time
+
+from capture import CaptureWriter, DATAGRAM
+from protocol import unpack_datagram
+from slot_table import (UDP_WORKER, FLAG_STALE, AGENT_TIMEOUT, STALE_GRACE,
+                        attach_table, adopt_orphan, claim_slot, write_slot, set_slot_flags, clear_slot)
+from timing_wheel import TimingWheel
+
+RECV_BUFFER = 4 * 1024 * 1024  # SO_RCVBUF: absorbs bursts while a batch is written
+MAX_DATAGRAM = 65535
+MAX_BATCH = 1024               # Datagrams decoded before the slot table is updated
+REPORT_INTERVAL = 10.0         # Seconds between loss reports
+SEQ_MODULO = 1 << 32
+REORDER_WINDOW = 64            # How far back a late datagram is still recognized
+RESTART_JUMP = 1 << 16         # A jump this far back is an agent restart, not a late datagram
+RESTART_GAP = 1.0              # Or one after this many seconds of silence
+RESTART_RUN = 8                # Or this many consecutive datagrams numbered from far back
+
+
+class SequenceTracker:
+    """
+    Loss accounting for one agent's sequence numbers (uint32, wrapping).
+    A bitmap of the last REORDER_WINDOW sequence numbers tells a late datagram
+    (counted as lost when the gap was seen, then un-counted) from a duplicate.
+    Further back, a datagram is only taken as an agent restart on a large jump,
+    after a silence, or once several in a row continue from it; otherwise it is
+    counted as too late to place.
+    """
+
+    __slots__ = ('highest', 'window', 'span', 'last_seen', 'behind', 'run',
+                 'received', 'lost', 'reordered', 'duplicates', 'late', 'restarts')
+
+    def __init__(self):
+        self.highest = None
+        self.window = 0  # Bit i set = highest - i was received
+        self.span = 0    # Window bits that lie after the first sequence number seen
+        self.last_seen = 0.0
+        self.behind = None  # Latest sequence number from beyond the window, and how many led up to it
+        self.run = 0
+        self.received = self.lost = self.reordered = self.duplicates = self.late = self.restarts = 0
+
+    def update(self, seq, now):
+        """Records one sequence number received at `now`. Returns False for a duplicate."""
+        silent = now - self.last_seen
+        self.last_seen = now
+        if self.highest is None:
+            self.highest, self.window, self.span = seq, 1, 1
+            self.received += 1
+            return True
+
+        # Serial number arithmetic: distance from the highest seen, in (-2^31, 2^31]
+        diff = (seq - self.highest) % SEQ_MODULO
+        if diff > SEQ_MODULO // 2:
+            diff -= SEQ_MODULO
+
+        if diff > 0:
+            self.lost += diff - 1
+            self.highest = seq
+            self.window = ((self.window << diff) | 1) & ((1 << REORDER_WINDOW) - 1)
+            self.span = min(self.span + diff, REORDER_WINDOW)
+        elif diff > -REORDER_WINDOW:
+            bit = 1 << -diff
+            if self.window & bit:
+                self.duplicates += 1
+                return False
+            self.window |= bit
+            self.reordered += 1
+            if -diff < self.span:
+                self.lost -= 1  # Was counted as lost when the gap was seen
+        else:
+            self.run = self.run + 1 if self.behind is not None and seq == (self.behind + 1) % SEQ_MODULO else 1
+            self.behind = seq
+            if -diff < RESTART_JUMP and silent < RESTART_GAP and self.run < RESTART_RUN:
+                self.late += 1  # Too far back to tell from a duplicate: neither received nor lost
+                return True
+            # The agent restarted and its sequence began again
+            self.restarts += 1
+            self.highest, self.window, self.span = seq, 1, 1
+            self.behind, self.run = None, 0
+        self.received += 1
+        return True
+
+    def summary(self):
+        expected = self.received + self.lost
+        loss = self.lost / expected * 100 if expected else 0.0
+        return (f"received={self.received} lost={self.lost} ({loss:.2f}%) "
+                f"reordered={self.reordered} duplicates={self.duplicates} late={self.late} restarts={self.restarts}")
+
+
+class UdpAgent:
+    __slots__ = ('agent_id', 'id_bytes', 'slot_index', 'addr_bytes', 'stale', 'refused', 'tracker')
+
+    def __init__(self, agent_id, slot_index, addr_bytes):
+        self.agent_id = agent_id
+        self.id_bytes = agent_id.encode('utf-8')[:64]
+        self.slot_index = slot_index
+        self.addr_bytes = addr_bytes
+        self.stale = False
+        self.refused = False  # Found the table full; logged once until it gets a slot
+        self.tracker = SequenceTracker()
+
+
+def drain(sock, buf, batch):
+    """Reads every queued datagram (up to MAX_BATCH) without blocking. Returns the count."""
+    view = memoryview(buf)
+    count = 0
+    while count < MAX_BATCH:
+        try:
+            n, addr = sock.recvfrom_into(buf)
+        except BlockingIOError:
+            break
+        batch.append((bytes(view[:n]), addr))
+        count += 1
+    return count
+
+
+def udp_collector_target(shm_name, lock, host, port, capture_path=None):
+    """Receives UDP datagrams from agents and writes their samples to shared memory."""
+    print("[UDP] Process started.")
+
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECV_BUFFER)
+        try:
+            s.bind((host, port))
+        except OSError as e:
+            print(f"[UDP] Cannot listen on {host}:{port}: {e}")
+            sys.exit(1)
+        s.setblocking(False)
+        print(f"[UDP] Listening on {host}:{port}")
+
+        shm = attach_table(shm_name)
+        capture = None
+        if capture_path:
+            capture = CaptureWriter(f"{capture_path}.udp")
+            print(f"[UDP] Recording traffic to {capture.path}")
+        agents = {}  # agent_id -> UdpAgent
+        liveness = TimingWheel()  # Deadlines by agent_id
+        buf = bytearray(MAX_DATAGRAM)
+        malformed = 0
+        table_full = 0  # Samples dropped since the last report: no free slot
+
+        next_report = time.monotonic()
+        while True:
+            select.select([s], [], [], liveness.tick)
+            batch = []
+            drain(s, buf, batch)
+            now = time.monotonic()
+
+            # Decode the whole batch first, then update the table under one lock
+            latest = {}  # agent_id -> stats; only the newest sample per agent is written
+            revived = []
+            for data, addr in batch:
+                if capture:
+                    capture.write(0, DATAGRAM, data)
+                try:
+                    agent_id, seq, stats = unpack_datagram(data)
+                except ValueError:
+                    malformed += 1
+                    continue
+                agent = agents.get(agent_id)
+                if agent is None:
+                    agent = UdpAgent(agent_id, None, f"udp:{agent_id}@{addr[0]}".encode('ascii', 'replace')[:64])
+                    agents[agent_id] = agent
+                liveness.arm(agent_id, AGENT_TIMEOUT, now)
+                if agent.stale:
+                    agent.stale = False
+                    revived.append(agent)
+                # A datagram without values is a heartbeat
+                if agent.tracker.update(seq, now) and seq == agent.tracker.highest and stats:
+                    latest[agent_id] = stats
+
+            stale, expired, refused = [], [], []
+            for agent_id in liveness.advance(now):
+                agent = agents[agent_id]
+                if agent.stale:
+                    expired.append(agent)
+                else:
+                    agent.stale = True
+                    liveness.arm(agent_id, STALE_GRACE, now)
+                    stale.append(agent)
+
+            if latest or stale or revived or expired:
+                with lock:
+                    for agent in revived:
+                        if agent.slot_index is not None and agent.agent_id not in latest:
+                            set_slot_flags(shm, agent.slot_index, 0)
+                    for agent in stale:
+                        if agent.slot_index is not None:
+                            set_slot_flags(shm, agent.slot_index, FLAG_STALE)
+                    for agent_id, stats in latest.items():
+                        agent = agents[agent_id]
+                        if agent.slot_index is None:
+                            # Its slot from before a warm restart, if it had one
+                            agent.slot_index = adopt_orphan(shm, agent.id_bytes, agent.addr_bytes, UDP_WORKER)
+                            if agent.slot_index is not None:
+                                print(f"[UDP] Agent {agent_id} rebound to slot {agent.slot_index}")
+                            else:
+                                agent.slot_index = claim_slot(shm, agent.addr_bytes, UDP_WORKER, agent.id_bytes)
+                                if agent.slot_index is None:
+                                    refused.append(agent)  # Retried on the next datagram
+                                    continue
+                                agent.refused = False
+                                print(f"[UDP] Agent {agent_id} assigned to slot {agent.slot_index}")
+                        write_slot(shm, agent.slot_index, agent.addr_bytes,
+                                   stats.get('cpu', 0.0), stats.get('ram', 0.0), UDP_WORKER, 0, agent.id_bytes, now)
+                    for agent in expired:
+                        if agent.slot_index is not None:
+                            clear_slot(shm, agent.slot_index)
+
+            table_full += len(refused)
+            for agent in refused:
+                if not agent.refused:
+                    agent.refused = True
+                    print(f"[UDP] No available slots for agent {agent.agent_id} (see --slots).")
+            for agent in stale:
+                print(f"[UDP] Agent {agent.agent_id} silent for {AGENT_TIMEOUT:.0f}s, marked stale.")
+            for agent in expired:
+                print(f"[UDP] Agent {agent.agent_id} stale for {STALE_GRACE:.0f}s, cleared slot {agent.slot_index}. "
+                      f"{agent.tracker.summary()}")
+                del agents[agent.agent_id]
+
+            if now >= next_report:
+                for agent in agents.values():
+                    print(f"[UDP] {agent.agent_id}: {agent.tracker.summary()}")
+                if malformed:
+                    print(f"[UDP] {malformed} malformed datagram(s) dropped.")
+                    malformed = 0
+                if table_full:
+                    print(f"[UDP] {table_full} sample(s) dropped: slot table full.")
+                    table_full = 0
+                next_report = now + REPORT_INTERVAL
@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# Measures the agent's own footprint: import time, time to first sample, RSS
+# and CPU% while it runs, for the default (psutil) and the --lean (/proc) mode.
+#
+# The agent talks to a throwaway local server started by this script, so no
+# master is needed:
+#
+#   python utils/agent_bench.py --duration 30
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+REPO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.append(REPO_DIR)
+from protocol import StreamDecoder
+
+CLK_TCK = os.sysconf('SC_CLK_TCK')
+
+
+def import_time(module):
+    """Seconds to import `module` in a fresh interpreter (best of 5)."""
+    code = f"import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)"
+    runs = [float(subprocess.check_output([sys.executable, '-c', code], cwd=REPO_DIR)) for _ in range(5)]
+    return min(runs)
+
+
+def cpu_seconds(pid):
+    # utime and stime are fields 14 and 15 of /proc/<pid>/stat (after the "(comm)" field)
+    with open(f'/proc/{pid}/stat') as f:
+        fields = f.read().rsplit(')', 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / CLK_TCK
+
+
+def rss_kb(pid):
+    with open(f'/proc/{pid}/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1])
+    return 0
+
+
+def run_agent(extra_args, duration):
+    """Runs one agent against a local sink. Returns (first sample s, RSS kB, CPU %, samples)."""
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.bind(('127.0.0.1', 0))
+    server.listen()
+    port = server.getsockname()[1]
+    first_data = threading.Event()
+    received = []
+
+    def sink():
+        conn, _ = server.accept()
+        decoder = StreamDecoder()
+        with conn:
+            while True:
+                data = conn.recv(65536)
+                if not data:
+                    break
+                # Only samples count: the agent also sends IDENTIFY, HELLO, ... messages
+                for msg in decoder.feed(data):
+                    if 'cpu' in msg:
+                        received.append(time.monotonic())
+                        first_data.set()
+
+    threading.Thread(target=sink, daemon=True).start()
+
+    start = time.monotonic()
+    agent = subprocess.Popen([sys.executable, '-u', 'agent.py', '--port', str(port)] + extra_args,
+                             cwd=REPO_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT)
+    try:
+        first_data.wait(timeout=30)
+        first_sample = time.monotonic() - start
+
+        # Steady state only: startup (imports) is reported separately
+        cpu0, t0 = cpu_seconds(agent.pid), time.monotonic()
+        time.sleep(duration)
+        cpu1, t1 = cpu_seconds(agent.pid), time.monotonic()
+        rss = rss_kb(agent.pid)
+    finally:
+        agent.terminate()
+        agent.wait()
+        server.close()
+    return first_sample, rss, (cpu1 - cpu0) / (t1 - t0) * 100, len(received)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Startup and overhead benchmark for agent.py")
+    parser.add_argument('--duration', type=float, default=30.0, help="Seconds to measure each agent (default: 30)")
+    args = parser.parse_args()
+
+    print(f"import agent               : {import_time('agent') * 1000:7.1f} ms (psutil is imported lazily)")
+    print(f"import psutil              : {import_time('psutil') * 1000:7.1f} ms (skipped by --lean)")
+    print()
+    print(f"{'mode':8} {'first sample':>13} {'RSS':>9} {'CPU':>8} {'samples':>8}")
+    for name, extra in (('default', []), ('lean', ['--lean'])):
+        first_sample, rss, cpu, samples = run_agent(extra, args.duration)
+        print(f"{name:8} {first_sample * 1000:10.0f} ms {rss / 1024:6.1f} MB {cpu:7.3f}% {samples:8d}")